@@ -73,18 +73,24 @@ def get_my_bookings(user: models.User, booking_filter: schemas.BookingFilter) ->
         raise exceptions.ForbiddenAccessException("Host cannot have bookings")
 
     booking_ids = booking_db.get_user_booking_ids(user.user_id, prep_filters(booking_filter))
+    bookings = [booking_db.get_booking(booking_id) for booking_id in booking_ids]
+    event_previews = event_preview.get_event_previews_by_id([booking.event_id for booking in bookings])
 
     return schemas.Bookings(
         bookings=[
-            get_booking_details(booking_id, user)
-            for booking_id in booking_ids
+            get_booking_info(booking, user, event_previews.get(booking.event_id))
+            for booking in bookings
         ]
     )
 
 
 def get_booking_details(booking_id: int, user: models.User) -> schemas.Booking:
-    booking = booking_db.get_booking(booking_id)
+    return get_booking_info(booking_db.get_booking(booking_id), user)
+
 
+def get_booking_info(
+    booking: models.Booking, user: models.User, event_info: schemas.EventListingPreview = None
+) -> schemas.Booking:
     if booking.customer_id != user.user_id:
         raise exceptions.ForbiddenAccessException("This user cannot view this booking.")
 
@@ -112,7 +118,7 @@ def get_booking_details(booking_id: int, user: models.User) -> schemas.Booking:
         amountSaved=booking.amount_saved,
         percentageOff=percentage_off,
         reserves=reserves,
-        eventInfo=event_preview.get_event_preview(booking.event),
+        eventInfo=event_info or event_preview.get_event_previews([booking.event_id])[0],
     )
 
 
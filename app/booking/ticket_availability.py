@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import WebSocket
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from .. import constants, models, schemas
+from ..database import db, run_with_db
+
+
+logger = logging.getLogger(__name__)
+
+# Tickets left keyed by (reserve name, section name), reserves themselves have no section name
+Tickets = Dict[Tuple[str, Optional[str]], int]
+
+
+class TicketChannel:
+    """
+    The websockets watching one event's remaining tickets, changes are pushed to all of them at most
+    once every TICKET_UPDATE_SECONDS however many bookings commit in between
+    """
+
+    def __init__(self, event_id: int):
+        self.event_id = event_id
+        self.connections: Set[WebSocket] = set()
+        self.tickets: Optional[Tickets] = None
+        self.changed = asyncio.Event()
+        self.task = asyncio.create_task(self.push_changes())
+
+    async def get_tickets(self) -> Tickets:
+        if self.tickets is None:
+            self.tickets = await run_with_db(load_tickets_left, self.event_id)
+        return self.tickets
+
+    async def push_changes(self):
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            try:
+                await self.push_tickets(await run_with_db(load_tickets_left, self.event_id))
+            except Exception:
+                logger.exception(f"Failed to push the tickets left for event {self.event_id}")
+
+            # Bookings committed while sleeping set changed again and are sent together
+            await asyncio.sleep(constants.TICKET_UPDATE_SECONDS)
+
+    async def push_tickets(self, tickets: Tickets):
+        previous = self.tickets or {}
+        changed = {key: left for key, left in tickets.items() if previous.get(key) != left}
+        self.tickets = tickets
+        if not changed:
+            return
+
+        message = get_ticket_availability(self.event_id, changed).json()
+        for connection in list(self.connections):
+            try:
+                await connection.send_text(message)
+            except Exception:
+                self.connections.discard(connection)
+
+
+channels: Dict[int, TicketChannel] = {}
+
+# Commits can happen on worker threads so changes are handed to the loop the channels run on
+channel_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# -------------------------------------------  Tickets  ---------------------------------------------- #
+
+
+def load_tickets_left(event_id: int) -> Tickets:
+    reserve, section = models.EventReserve, models.EventSection
+    rows = db.get().execute(
+        select(
+            reserve.reserve_name,
+            reserve.tickets_available,
+            models.VenueSection.section_name,
+            section.tickets_available.label("section_tickets_available"),
+        )
+        .outerjoin(section, section.event_reserve_id == reserve.event_reserve_id)
+        .outerjoin(models.VenueSection, models.VenueSection.section_id == section.venue_section_id)
+        .where(reserve.event_id == event_id)
+    ).all()
+
+    tickets = {}
+    for row in rows:
+        tickets[(row.reserve_name, None)] = row.tickets_available
+        if row.section_name is not None:
+            tickets[(row.reserve_name, row.section_name)] = row.section_tickets_available
+    return tickets
+
+
+def get_ticket_availability(event_id: int, tickets: Tickets) -> schemas.TicketAvailability:
+    return schemas.TicketAvailability(
+        eventListingId=event_id,
+        reserves=[
+            schemas.ReserveTicketsLeft(reserveName=reserve, ticketsLeft=left)
+            for (reserve, section), left in tickets.items()
+            if section is None
+        ],
+        sections=[
+            schemas.SectionTicketsLeft(sectionName=section, reserve=reserve, ticketsLeft=left)
+            for (reserve, section), left in tickets.items()
+            if section is not None
+        ],
+    )
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# -------------------------------------------  Watchers  --------------------------------------------- #
+
+
+async def watch(websocket: WebSocket, event_id: int):
+    global channel_loop
+    channel_loop = asyncio.get_running_loop()
+
+    await websocket.accept()
+    channel = channels.get(event_id)
+    if channel is None:
+        channel = channels[event_id] = TicketChannel(event_id)
+    # Registered before the first send so the caller's unwatch also removes a socket that drops during it
+    channel.connections.add(websocket)
+
+    tickets = await channel.get_tickets()
+    await websocket.send_text(get_ticket_availability(event_id, tickets).json())
+
+
+def unwatch(websocket: WebSocket, event_id: int):
+    channel = channels.get(event_id)
+    if channel is None:
+        return
+
+    channel.connections.discard(websocket)
+    if not channel.connections:
+        channel.task.cancel()
+        del channels[event_id]
+
+
+def notify_tickets_changed(event_ids: Iterable[int]):
+    for event_id in event_ids:
+        channel = channels.get(event_id)
+        if channel is not None:
+            channel_loop.call_soon_threadsafe(channel.changed.set)
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ------------------------------------  Write Notification  ------------------------------------------ #
+
+
+@event.listens_for(Session, "after_flush")
+def _track_booked_events(session: Session, flush_context):
+    # Bookings and their cancellations move tickets through triggers, hosts can also edit reserves
+    event_ids = session.info.setdefault("ticket_event_ids", set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (models.Booking, models.EventReserve)) and instance.event_id is not None:
+            event_ids.add(instance.event_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_booked_events(session: Session):
+    event_ids = session.info.pop("ticket_event_ids", set())
+    if event_ids and channels:
+        notify_tickets_changed(event_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_booked_events(session: Session):
+    session.info.pop("ticket_event_ids", None)
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class TTLCache:
+    """
+    Thread safe in-process cache, entries expire after ttl seconds and the least
+    recently used entry is evicted once max_size is reached
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            # Evict the least recently used entries
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+_MISSING = object()
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ------------------------------------  Write Invalidation  ------------------------------------------ #
+
+# Caches paired with the models whose writes make them stale
+_watched_caches: List[Tuple[TTLCache, tuple]] = []
+
+
+def clear_on_write(cache: TTLCache, *watched_models):
+    """
+    Clear the cache whenever a transaction writing to any of the watched models commits
+    """
+    _watched_caches.append((cache, watched_models))
+
+
+def _mark_stale(session: Session, written_models):
+    stale_caches = session.info.setdefault("stale_caches", set())
+    for cache, watched_models in _watched_caches:
+        if any(issubclass(model, watched_models) for model in written_models):
+            stale_caches.add(cache)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flushed_writes(session: Session, flush_context):
+    written_models = {type(instance) for instance in (*session.new, *session.dirty, *session.deleted)}
+    _mark_stale(session, written_models)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_writes(orm_execute_state):
+    # Bulk inserts, query.update() and query.delete() calls bypass the flush
+    is_write = orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete
+    if is_write and orm_execute_state.bind_mapper:
+        _mark_stale(orm_execute_state.session, {orm_execute_state.bind_mapper.class_})
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_stale_caches(session: Session):
+    for cache in session.info.pop("stale_caches", set()):
+        cache.clear()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_stale_caches(session: Session):
+    session.info.pop("stale_caches", None)
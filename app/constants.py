@@ -34,18 +34,83 @@ class SortOption(Enum):
     ALPHABETICAL = "alphabetical"
     ALPHABETICAL_REVERSE = "alphabeticalReverse"
     RELEVANCE = "relevance"
+    NEAREST = "nearest"
+
+
+class TagOrder(Enum):
+    NAME = "name"
+    POPULAR = "popular"
 
 
 TRENDING = 8
 SEARCH_RESULTS = 16
+SEARCH_LANGUAGE = "english"
+DEFAULT_KM_NEAR_ME = 50
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = 111.045
+MAX_DISTANCE_KM = 20038
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_SECONDS = 30
+SEARCH_CACHE_COORD_DECIMALS = 2
+SEARCH_PRICE_BUCKETS = (25, 50, 100, 200)
+SEARCH_DATE_BUCKETS = (("today", 1), ("thisWeek", 7), ("thisMonth", 30))
+SUGGESTIONS = 8
+SUGGEST_MIN_LENGTH = 2
+SUGGEST_CACHE_SIZE = 2048
+SUGGEST_CACHE_SECONDS = 300
 START = 0
 TITLE_TO_COMPARE = "event_title_to_compare"
 DESCRIPTION_TO_COMPARE = "event_description_to_compare"
-SIMILARITY_THRESHOLD = 0.8
+CONTENT_SIMILARITY_THRESHOLD = 0.5
+EVENT_FEATURE_DIMENSIONS = 2 ** 18
+EVENT_FEATURES_REBUILD_SECONDS = 60 * 60
+RECOMMENDATIONS_PER_USER = 200
+RECOMMENDATION_POPULAR_CANDIDATES = 500
+RECOMMENDATION_MAX_CANDIDATES = 5000
+RECOMMENDATION_REFRESH_SECONDS = 5 * 60
+RECOMMENDATION_QUEUE_SECONDS = 2
 HIGH_SCORE = 1.5
 LIKE_WEIGHT = 2
 POPULARITY_WEIGHT = 0.5
 FOLLOW_WEIGHT = 1
+NEIGHBOUR_WEIGHT = 2
+EVENT_NEIGHBOURS = 20
+ALSO_BOOKED_RESULTS = 8
+CO_BOOKING_BOOKING_WEIGHT = 3
+CO_BOOKING_FAVOURITE_WEIGHT = 2
+CO_BOOKING_LIKE_WEIGHT = 1
+CO_BOOKING_SHARD_SIZE = 1000
+CO_BOOKING_BATCH_SIZE = 5000
+TRENDING_LIKE_WEIGHT = 1
+TRENDING_BOOKING_WEIGHT = 3
+TRENDING_VIEW_WEIGHT = 0.1
+TRENDING_HALF_LIFE_DAYS = 3
+TRENDING_WINDOW_DAYS = 30
+TRENDING_REFRESH_SECONDS = 60
+
+# ------------------------ Map Clusters ----------------------------
+MAP_MAX_ZOOM = 20
+MAP_MAX_TILES = 64
+MAP_CLUSTER_CELLS = 4
+MAP_CLUSTER_TOP_EVENTS = 3
+MAP_TILE_CACHE_SIZE = 4096
+MAP_TILE_CACHE_SECONDS = 60
+
+# ------------------------ Event Details ----------------------------
+EVENT_DETAIL_CACHE_SIZE = 2048
+EVENT_DETAIL_CACHE_SECONDS = 10 * 60
+
+# ------------------------ Streaming ----------------------------
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 500
+
+# ------------------------ HTTP Caching ----------------------------
+# Stored but revalidated with the ETag on every use
+PUBLIC_CACHE_CONTROL = "public, no-cache"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+# The leaderboard only changes when the periodic job runs so trending can be reused for a while
+TRENDING_CACHE_CONTROL = "public, max-age=60"
+VENUES_CONTENT = "venues"
 
 # ------------------------ Event Types ----------------------------
 ONLINE = "online"
@@ -73,12 +138,19 @@ SALES_DATA_LIMIT = 15
 
 # ------------------------ Booking ----------------------------
 BOOKING_CUTOFF_DAYS = 7
+# Least time between two ticket availability pushes for the same event
+TICKET_UPDATE_SECONDS = 1
 
 
 # ------------------------ Socials ----------------------------
 LIKE = "like"
 DISLIKE = "dislike"
 NONE = "none"
+# Reviews rate from 0 up to this many stars
+MAX_RATING = 5
+
+# Event listings per bulk user info request
+USER_INFO_MAX_EVENTS = 100
 
 
 # ------------------------ Deleted Users ----------------------------
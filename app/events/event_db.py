@@ -1,7 +1,7 @@
 from typing import List
 from sqlalchemy import func, and_
 
-from .. import constants, exceptions, models, schemas
+from .. import constants, exceptions, helpers, models, schemas
 from ..database import db
 
 
@@ -35,10 +35,13 @@ def create_online_event(online_event_info: schemas.OnlineEventSpecifics, event_i
 
 
 def create_in_person_event(in_person_event_info: schemas.InPersonEventSpecifics, event_id: int):
+    latitude, longitude = helpers.parse_coordinates(in_person_event_info.locationCoord)
     in_person_event = models.NotSeatedEvent(
         not_seated_event_id=event_id,
         location=in_person_event_info.location,
         location_coords=in_person_event_info.locationCoord,
+        latitude=latitude,
+        longitude=longitude,
     )
 
     db.get().add(in_person_event)
@@ -267,18 +270,17 @@ def is_event_editable(event_id: int):
 
 
 def get_event_average_rating(event_id: int) -> float:
-    ratings = db.get().query(models.EventReview).filter(models.EventReview.event_id == event_id).all()
-
-    total_ratings = 0
-    total_count = 0
-    for rating in ratings:
-        total_ratings = total_ratings + rating.rating
-        total_count = total_count + 1
-
-    if total_count == 0:
+    # Running totals kept by triggers on event_reviews
+    ratings = (
+        db.get()
+        .query(models.Event.rating_sum, models.Event.rating_count)
+        .filter(models.Event.event_id == event_id)
+        .first()
+    )
+    if ratings is None:
         return None
 
-    return total_ratings / total_count
+    return helpers.get_average_rating(ratings.rating_sum, ratings.rating_count)
 
 
 def commit_db():
@@ -1,63 +1,143 @@
-from typing import List
+from typing import Dict, List, Optional
+from sqlalchemy import exists, false, func, select
+from sqlalchemy.orm import joinedload, selectinload
 
-from .. import constants, models, schemas, exceptions
-from ..socials import socials_db, reviews_db
-from ..booking import booking_db
-from ..surveys import surveys_db
-from . import event_db
+from .. import constants, helpers, models, schemas, exceptions
+from ..cache import TTLCache
+from ..database import db
+
+
+# Event details without the host or user parts, keyed by event id and version so writes are never served stale
+detail_cache = TTLCache(max_size=constants.EVENT_DETAIL_CACHE_SIZE, ttl=constants.EVENT_DETAIL_CACHE_SECONDS)
 
 # ---------------------------------------------------------------------------------------------------- #
 # ------------------------------------  Event Listing Details  --------------------------------------- #
 
 
 def get_event_listing_details(event_id: int, user: models.User = None) -> schemas.EventDetails:
+    event_info = get_event_info(event_id)
+    user_info = None if not user else get_user_event_interactions(event_id, user.user_id)
+    return build_event_listing_details(event_id, event_info, user_info)
+
+
+def get_event_info(event_id: int):
+    # The version and the host change independently of the event so are read on every request
+    event_info = get_event_version_and_host(event_id)
+    if event_info is None:
+        raise exceptions.NotFoundException(f"Event '{event_id}' could not be found.")
+
+    return event_info
+
+
+def build_event_listing_details(
+    event_id: int, event_info, user_info: schemas.UserInfoEventListing = None
+) -> schemas.EventDetails:
+    details_key = (event_id, event_info.version)
+    event_details = detail_cache.get(details_key)
+    if event_details is None:
+        event_details = load_event_details(event_id, event_info)
+        detail_cache.set(details_key, event_details)
+
+    host_info = get_host_info(event_info)
+    return event_details.copy(update={"hostInfo": host_info, "rating": event_info.rating, "userInfo": user_info})
+
+
+def get_event_version(event_id: int) -> int:
+    version = db.get().query(models.EventVersion.version).filter(models.EventVersion.event_id == event_id).scalar()
+    return version or 0
+
+
+def get_event_version_and_host(event_id: int):
+    hosts = models.Host.__table__
+    return (
+        db.get()
+        .query(
+            func.coalesce(models.EventVersion.version, 0).label("version"),
+            models.Event.host_id,
+            hosts.c.org_name,
+            hosts.c.description,
+            hosts.c.org_email,
+            hosts.c.banner,
+            hosts.c.num_followers,
+            hosts.c.rating,
+            hosts.c.num_events,
+        )
+        .join(hosts, hosts.c.host_id == models.Event.host_id)
+        .outerjoin(models.EventVersion, models.EventVersion.event_id == models.Event.event_id)
+        .filter(models.Event.event_id == event_id)
+        .first()
+    )
 
-    event = event_db.get_event(event_id)
 
-    is_event_editable = event_db.is_event_editable(event_id)
-    average_rating = event_db.get_event_average_rating(event_id)
-    tags = [event_tag.tag.tag_name for event_tag in event.tags]
-    images = [image.media for image in event.event_media.filter(models.EventMedia.media_type == constants.IMAGE)]
-    youtube_links = [image.media for image in event.event_media.filter(models.EventMedia.media_type == constants.YOUTUBE)]
-    faqs = get_event_FAQs(event)
-    ticketsLeft = event_db.calculate_tickets_available(event_id)
-    announcements = get_event_announcements(event)
-    host_info = get_host_info(event.host)
-    user_info = None if not user else get_user_event_interactions(event, user.user_id)
+def load_event_details(event_id: int, event_info) -> schemas.EventDetails:
+    """
+    The event page loaded in a fixed number of queries, the host and user parts are replaced on every request
+    """
+    event = (
+        db.get()
+        .query(models.Event)
+        .options(
+            joinedload(models.Event.online_event),
+            joinedload(models.Event.not_seated_event),
+            joinedload(models.Event.seated_event).joinedload(models.SeatedEvent.venue),
+            selectinload(models.Event.tags).joinedload(models.EventTag.tag),
+            selectinload(models.Event.faqs),
+            selectinload(models.Event.announcements),
+            selectinload(models.Event.reserves)
+            .selectinload(models.EventReserve.sections)
+            .joinedload(models.EventSection.venue_section),
+        )
+        .filter(models.Event.event_id == event_id)
+        .one_or_none()
+    )
+    if event is None:
+        raise exceptions.NotFoundException(f"Event '{event_id}' could not be found.")
+
+    media = (
+        db.get()
+        .query(models.EventMedia.media_type, models.EventMedia.media)
+        .filter(models.EventMedia.event_id == event_id)
+        .order_by(models.EventMedia.media_id)
+        .all()
+    )
+
+    # Events can be edited until they have an active booking
+    has_bookings = db.get().execute(
+        select(exists().where(models.Booking.event_id == event_id, models.Booking.cancelled.is_(False)))
+    ).scalar()
 
-    response = schemas.EventDetails(
+    return schemas.EventDetails(
         title=event.title,
         startDateTime=event.start_time,
         endDateTime=event.end_time,
         type=event.event_type,
-        editable=is_event_editable,
-        averageRating=average_rating,
+        editable=not has_bookings,
+        averageRating=helpers.get_average_rating(event.rating_sum, event.rating_count),
+        ratingCounts=event.rating_counts,
         cancelled=event.cancelled,
         eventListingId=event.event_id,
         memberId=event.host_id,
         summary=event.summary,
         description=event.description,
-        tags=tags,
-        images=images,
-        youtubeLinks=youtube_links,
-        faq=faqs,
+        tags=[event_tag.tag.tag_name for event_tag in event.tags],
+        images=[item.media for item in media if item.media_type == constants.IMAGE],
+        youtubeLinks=[item.media for item in media if item.media_type == constants.YOUTUBE],
+        faq=get_event_FAQs(event),
         noLikes=event.likes,
         noDislikes=event.dislikes,
         minimumCost=event.minimum_cost,
         edited=event.edited,
-        ticketsLeft=ticketsLeft,
-        rating=event.host.rating,
-        announcements=announcements,
-        hostInfo=host_info,
-        userInfo=user_info,
+        ticketsLeft=sum(reserve.tickets_available for reserve in event.reserves),
+        rating=event_info.rating,
+        announcements=get_event_announcements(event),
+        hostInfo=get_host_info(event_info),
+        userInfo=None,
         online=get_online_event_details(event),
         inpersonNonSeated=get_non_seated_event_details(event),
         inpersonSeated=get_seated_event_details(event),
-        surveyMade=surveys_db.get_made_survey_bool(event.event_id),
+        surveyMade=bool(event.survey_made),
     )
 
-    return response
-
 
 # ---------------------------------------------------------------------------------------------------- #
 # ---------------------------------------------  Helpers  -------------------------------------------- #
@@ -139,25 +219,74 @@ def get_reserve_info(event: models.Event) -> List[schemas.EventReserve]:
 # ---------------------------------  Event User/Host Info  ------------------------------------------- #
 
 
-def get_user_event_interactions(event: models.Event, user_id: int) -> schemas.UserInfoEventListing:
+def get_user_event_interactions(event_id: int, user_id: Optional[int]) -> schemas.UserInfoEventListing:
+    return get_user_events_interactions([event_id], user_id).get(event_id)
+
 
-    reaction = socials_db.get_user_event_reaction(event.event_id, user_id)
-    favourite = socials_db.is_event_favourited(event.event_id, user_id)
-    follows_host = socials_db.user_follows_host(event.host_id, user_id)
-    bought_ticket = booking_db.user_has_booked(user_id, event.event_id)
-    has_reviewed = reviews_db.user_has_reviewed(user_id, event.event_id)
+def get_user_events_interactions(
+    event_ids: List[int], user_id: Optional[int]
+) -> Dict[int, schemas.UserInfoEventListing]:
+    """
+    The user's reaction, favourite, follow, booking and review flags for every event in one query,
+    event ids that do not exist are left out and anonymous users get every flag unset
+    """
+    if len(event_ids) > constants.USER_INFO_MAX_EVENTS:
+        raise exceptions.InvalidInputException(
+            f"User info can be requested for at most {constants.USER_INFO_MAX_EVENTS} events at a time."
+        )
 
-    # reaction, favourited, followsHost, boughtTicket, hasReviewed
-    return schemas.UserInfoEventListing(
-        reaction=reaction,
-        favourited=favourite,
-        followsHost=follows_host,
-        boughtTicket=bought_ticket,
-        hasReviewed=has_reviewed,
+    event = models.Event
+    liked = exists().where(models.Like.customer_id == user_id, models.Like.event_id == event.event_id)
+    disliked = exists().where(models.Dislike.customer_id == user_id, models.Dislike.event_id == event.event_id)
+    favourited = exists().where(
+        models.FavouritedEvent.customer_id == user_id, models.FavouritedEvent.event_id == event.event_id
+    )
+    follows_host = exists().where(models.Follower.customer_id == user_id, models.Follower.host_id == event.host_id)
+    bought_ticket = exists().where(
+        models.Booking.customer_id == user_id,
+        models.Booking.event_id == event.event_id,
+        models.Booking.cancelled.is_(False),
     )
+    has_reviewed = exists().where(
+        models.EventReview.customer_id == user_id, models.EventReview.event_id == event.event_id
+    )
+    if user_id is None:
+        liked = disliked = favourited = follows_host = bought_ticket = has_reviewed = false()
+
+    rows = db.get().execute(
+        select(
+            event.event_id,
+            liked.label("liked"),
+            disliked.label("disliked"),
+            favourited.label("favourited"),
+            follows_host.label("follows_host"),
+            bought_ticket.label("bought_ticket"),
+            has_reviewed.label("has_reviewed"),
+        ).where(event.event_id.in_(event_ids))
+    ).all()
+
+    return {
+        row.event_id: schemas.UserInfoEventListing(
+            reaction=get_reaction(row.liked, row.disliked),
+            favourited=row.favourited,
+            followsHost=row.follows_host,
+            boughtTicket=row.bought_ticket,
+            hasReviewed=row.has_reviewed,
+        )
+        for row in rows
+    }
+
+
+def get_reaction(liked: bool, disliked: bool) -> str:
+    if liked:
+        return constants.LIKE
+    elif disliked:
+        return constants.DISLIKE
+    else:
+        return constants.NONE
 
 
-def get_host_info(host: models.Host) -> schemas.HostInformation:
+def get_host_info(host) -> schemas.HostInformation:
     if not host:
         return None
 
@@ -1,8 +1,8 @@
-from typing import List
-from sqlalchemy import select, distinct, func
-from sqlalchemy.sql.expression import null
+from typing import Dict, List, Tuple
+from sqlalchemy import func, select
 
 from .. import constants, models, schemas
+from ..database import db
 
 
 # ---------------------------------------------------------------------------------------------------- #
@@ -10,117 +10,112 @@ from .. import constants, models, schemas
 
 
 def get_event_preview(event: models.Event) -> schemas.EventListingPreview:
-
-    return schemas.EventListingPreview(
-        eventListingId=event.event_id,
-        thumbnail=event.thumbnail,
-        orgName="" if not event.host.org_name else event.host.org_name,
-        noLikes=event.likes,
-        noFollowers=event.host.num_followers,
-        minimumCost=event.minimum_cost,
-        location=get_event_location(event),
-        hostId=event.host_id,
-        title=event.title,
-        startDateTime=event.start_time.isoformat(),
-        endDateTime=event.end_time.isoformat(),
-        type=event.event_type,
+    return get_event_previews([event.event_id])[0]
+
+
+def get_event_previews(event_ids: List[int], *filters) -> List[schemas.EventListingPreview]:
+    """
+    Previews of the events in the order given, events not found or filtered out are skipped
+    """
+    previews = get_event_previews_by_id(event_ids, *filters)
+    return [previews[event_id] for event_id in event_ids if event_id in previews]
+
+
+def get_event_previews_by_id(event_ids: List[int], *filters) -> Dict[int, schemas.EventListingPreview]:
+    if not event_ids:
+        return {}
+
+    # One query for the event, host and venue columns rather than lazy loading them per event
+    hosts = models.Host.__table__
+    results = (
+        db.get()
+        .query(
+            models.Event.event_id,
+            models.Event.thumbnail,
+            hosts.c.org_name,
+            models.Event.likes,
+            hosts.c.num_followers,
+            models.Event.minimum_cost,
+            models.Event.host_id,
+            models.Event.title,
+            models.Event.start_time,
+            models.Event.end_time,
+            models.Event.event_type,
+            models.Venue.name.label("venue_name"),
+        )
+        .join(hosts, hosts.c.host_id == models.Event.host_id)
+        .outerjoin(models.SeatedEvent, models.SeatedEvent.seated_event_id == models.Event.event_id)
+        .outerjoin(models.Venue, models.Venue.venue_id == models.SeatedEvent.venue_id)
+        .filter(models.Event.event_id.in_(set(event_ids)))
+        .filter(*filters)
+        .all()
     )
 
+    return {
+        result.event_id: schemas.EventListingPreview(
+            eventListingId=result.event_id,
+            thumbnail=result.thumbnail,
+            orgName="" if not result.org_name else result.org_name,
+            noLikes=result.likes,
+            noFollowers=result.num_followers,
+            minimumCost=result.minimum_cost,
+            location=get_event_location(result.event_type, result.venue_name),
+            hostId=result.host_id,
+            title=result.title,
+            startDateTime=result.start_time.isoformat(),
+            endDateTime=result.end_time.isoformat(),
+            type=result.event_type,
+        )
+        for result in results
+    }
 
-def get_event_location(event: models.Event):
-    if event.event_type == constants.SEATED:
-        try:
-            return event.seated_event.venue.name
-        except Exception:
-            pass
-
-    elif event.event_type == constants.INPERSON:
-        try:
-            return event.not_seated_event.venue.name
-        except Exception:
-            pass
 
+def get_event_location(event_type: str, venue_name: str) -> str:
+    # Only seated events are held at a venue
+    if event_type == constants.SEATED and venue_name:
+        return venue_name
     return ""
 
 
-# ---------------------------------------------------------------------------------------------------- #
-# -------------------------------- Search - Preview With Metadata  ----------------------------------- #
-
-
-def get_online_events_preview():
-    preview_model = (
+def get_event_preview_versions(event_ids: List[int], *filters) -> Dict[int, Tuple[int, int]]:
+    """
+    The event and host version of each event's preview, events not found or filtered out are skipped
+    """
+    event = models.Event
+    results = db.get().execute(
         select(
-            distinct(models.Event.event_id).label("eventListingId"),
-            models.Event.thumbnail.label("thumbnail"),
-            models.Host.org_name.label("orgName"),
-            models.Event.likes.label("noLikes"),
-            models.Host.num_followers.label("noFollowers"),
-            models.Event.minimum_cost.label("minimumCost"),
-            models.Host.host_id.label("hostId"),
-            models.Event.start_time.label("startDateTime"),
-            models.Event.end_time.label("endDateTime"),
-            models.Event.event_type.label("type"),
-            null().label("location"),
-            null().label("location_coords"),
-            models.Event.title.label("title"),
+            event.event_id,
+            func.coalesce(models.EventVersion.version, 0),
+            func.coalesce(models.HostVersion.version, 0),
         )
-        .join(models.Host, models.Event.host_id == models.Host.host_id)
-        .join(models.EventTag, models.Event.event_id == models.EventTag.event_id, isouter=True)
-        .join(models.Tag, models.Tag.tag_id == models.EventTag.tag_id, isouter=True)
-        .filter(func.lower(models.Event.event_type) == "online")
-    )
-    return preview_model
+        .outerjoin(models.EventVersion, models.EventVersion.event_id == event.event_id)
+        .outerjoin(models.HostVersion, models.HostVersion.host_id == event.host_id)
+        .where(event.event_id.in_(event_ids), *filters)
+    ).all()
+    return {event_id: (event_version, host_version) for event_id, event_version, host_version in results}
 
 
-def get_non_seated_events_preview():
-    preview_model = (
-        select(
-            distinct(models.Event.event_id).label("eventListingId"),
-            models.Event.thumbnail.label("thumbnail"),
-            models.Host.org_name.label("orgName"),
-            models.Event.likes.label("noLikes"),
-            models.Host.num_followers.label("noFollowers"),
-            models.Event.minimum_cost.label("minimumCost"),
-            models.Host.host_id.label("hostId"),
-            models.Event.start_time.label("startDateTime"),
-            models.Event.end_time.label("endDateTime"),
-            models.Event.event_type.label("type"),
-            models.NotSeatedEvent.location.label("location"),
-            models.NotSeatedEvent.location_coords.label("location_coords"),
-            models.Event.title.label("title"),
-        )
-        .join(models.Host, models.Event.host_id == models.Host.host_id)
-        .join(models.NotSeatedEvent, models.Event.event_id == models.NotSeatedEvent.not_seated_event_id)
-        .join(models.EventTag, models.Event.event_id == models.EventTag.event_id, isouter=True)
-        .join(models.Tag, models.Tag.tag_id == models.EventTag.tag_id, isouter=True)
-        .filter(models.Event.event_type == "inpersonNonSeated")
-    )
-    return preview_model
+# ---------------------------------------------------------------------------------------------------- #
+# -------------------------------- Search - Preview With Metadata  ----------------------------------- #
 
 
-def get_seated_events_preview():
-    preview_model = (
-        select(
-            distinct(models.Event.event_id).label("eventListingId"),
-            models.Event.thumbnail.label("thumbnail"),
-            models.Host.org_name.label("orgName"),
-            models.Event.likes.label("noLikes"),
-            models.Host.num_followers.label("noFollowers"),
-            models.Event.minimum_cost.label("minimumCost"),
-            models.Host.host_id.label("hostId"),
-            models.Event.start_time.label("startDateTime"),
-            models.Event.end_time.label("endDateTime"),
-            models.Event.event_type.label("type"),
-            models.Venue.location.label("location"),
-            models.Venue.location_coords.label("location_coords"),
-            models.Event.title.label("title"),
-        )
-        .join(models.Host, models.Event.host_id == models.Host.host_id)
-        .join(models.SeatedEvent, models.Event.event_id == models.SeatedEvent.seated_event_id)
-        .join(models.EventTag, models.Event.event_id == models.EventTag.event_id, isouter=True)
-        .join(models.Tag, models.Tag.tag_id == models.EventTag.tag_id, isouter=True)
-        .join(models.Venue, models.SeatedEvent.venue_id == models.Venue.venue_id)
-        .filter(models.Event.event_type == "inpersonSeated")
+def get_search_documents_preview():
+    document = models.EventSearchDocument
+    preview_model = select(
+        document.event_id.label("eventListingId"),
+        document.thumbnail.label("thumbnail"),
+        document.org_name.label("orgName"),
+        document.likes.label("noLikes"),
+        document.num_followers.label("noFollowers"),
+        document.minimum_cost.label("minimumCost"),
+        document.host_id.label("hostId"),
+        document.start_time.label("startDateTime"),
+        document.end_time.label("endDateTime"),
+        document.event_type.label("type"),
+        document.location.label("location"),
+        document.latitude.label("latitude"),
+        document.longitude.label("longitude"),
+        document.title.label("title"),
     )
     return preview_model
 
@@ -0,0 +1,44 @@
+import itertools
+from typing import Iterable, Iterator
+
+from fastapi.responses import StreamingResponse
+
+from .. import constants
+from ..database import db, get_db
+from . import event_preview
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# --------------------------------------------  Ids  ------------------------------------------------- #
+
+
+def get_streamed_ids(query) -> Iterator[int]:
+    # Server side cursor so only one batch of event ids is held at a time
+    for row in db.get().execute(query.execution_options(yield_per=constants.STREAM_BATCH_SIZE)):
+        yield row[0]
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ------------------------------------------  Response  ---------------------------------------------- #
+
+
+def get_preview_lines(event_ids: Iterable[int], *filters) -> Iterator[str]:
+    # The request session closes once the response starts so the stream reads through its own
+    with get_db() as session:
+        event_ids = iter(event_ids)
+        while True:
+            # Each batch may be read on a different worker thread so set the session before every one
+            db.set(session)
+            batch = list(itertools.islice(event_ids, constants.STREAM_BATCH_SIZE))
+            if not batch:
+                return
+            for preview in event_preview.get_event_previews(batch, *filters):
+                yield preview.json() + "\n"
+
+
+def get_preview_stream(event_ids: Iterable[int], *filters) -> StreamingResponse:
+    """
+    Newline delimited previews built exactly as the listings build them, in the order of event_ids and
+    skipping events filtered out, event_ids may be lazy so no query runs until the response streams
+    """
+    return StreamingResponse(get_preview_lines(event_ids, *filters), media_type=constants.NDJSON_MEDIA_TYPE)
@@ -2,13 +2,13 @@ from datetime import datetime
 import re
 import string
 import random
-from typing import List
+from typing import List, Optional, Tuple
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import smtplib
 
 from fastapi import HTTPException
-from .exceptions import BadGatewayException
+from .exceptions import BadGatewayException, InvalidInputException
 from . import constants as c
 
 
@@ -58,6 +58,20 @@ def send_email_with_gmail(to: List[str], subject: str, body: str):
         raise BadGatewayException("Failed to send email.")
 
 
+def parse_coordinates(location_coords: str) -> Tuple[float, float]:
+    # Convert the "(lat,lng)" coordinate format to floats
+    try:
+        latitude, longitude = location_coords.strip().strip("()").split(",")
+        latitude, longitude = float(latitude.strip()), float(longitude.strip())
+    except Exception:
+        raise InvalidInputException("Invalid location coordinates")
+
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise InvalidInputException("Invalid location coordinates")
+
+    return latitude, longitude
+
+
 def check_before_end_date(enddate):
     current_datetime = datetime.now()
     if current_datetime < enddate:
@@ -65,5 +79,11 @@ def check_before_end_date(enddate):
 
 
 def verify_review_rating(rating):
-    if rating < 0 or rating > 5:
-        raise HTTPException(status_code=400, detail="Rating must be in between 0 and 5")
+    if rating < 0 or rating > c.MAX_RATING:
+        raise HTTPException(status_code=400, detail=f"Rating must be in between 0 and {c.MAX_RATING}")
+
+
+def get_average_rating(rating_sum: int, rating_count: int) -> Optional[float]:
+    if not rating_count:
+        return None
+    return rating_sum / rating_count
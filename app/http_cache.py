@@ -0,0 +1,45 @@
+import hashlib
+from typing import Any, Callable
+
+from fastapi import Request, Response
+
+from . import constants, models
+
+
+def get_etag(*versions) -> str:
+    """
+    Strong entity tag of the versions a response is built from, the same versions always give the same tag
+    so it matches across workers and restarts
+    """
+    return '"' + hashlib.sha1(repr(versions).encode()).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    # If-None-Match compares weakly so a tag a proxy marked weak still matches
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag[2:] == etag if tag.startswith("W/") else tag == etag for tag in tags)
+
+
+def get_cache_control(user: models.User = None) -> str:
+    # Responses with the user's own flags must not be stored by shared caches
+    return constants.PRIVATE_CACHE_CONTROL if user else constants.PUBLIC_CACHE_CONTROL
+
+
+def get_conditional_response(
+    request: Request, response: Response, etag: str, cache_control: str, load: Callable[[], Any]
+) -> Any:
+    """
+    A 304 without calling load when the client already holds this etag, otherwise the loaded body with the
+    caching headers set on the response
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Authorization"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return load()
@@ -1,8 +1,10 @@
 import argparse
+import asyncio
 import json
 from typing import Union, Dict
 import uvicorn
-from app.database import engine, get_db, db, SessionLocal
+from starlette.concurrency import run_in_threadpool
+from app.database import engine, db, run_with_db, LazySession
 import os
 
 from fastapi import (
@@ -11,6 +13,7 @@ from fastapi import (
     HTTPException,
     status,
     Request,
+    Response,
     WebSocket,
     WebSocketDisconnect,
     BackgroundTasks,
@@ -19,15 +22,15 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 
 
-from . import constants, models, schemas
+from . import constants, http_cache, models, schemas
 from .auth import auth_db, authenticate, twofa, validations
 from .auth.authenticate import get_current_user, get_user_or_none
 from .billing import billing, transactions
-from .booking import booking, referral
+from .booking import booking, referral, ticket_availability
 from .profile import host_profile, profile_db, host_analytics
-from .search import recommend, search
+from .search import features, recommend, search, map_clusters, suggest, trending
 from .socials import favourites, follow, reviews_db, socials_db
-from .venues import venue
+from .venues import venue, venue_db
 from .chat import messages
 from .events import event_db, create_event, delete_event, event_listings, event_update
 from .surveys import create_surveys, delete_surveys, get_surveys, submit_surveys
@@ -63,17 +66,43 @@ with get_db() as session:
     db.set(session)
 """
 
+# Keep a reference so the periodic jobs are not garbage collected
+background_jobs = set()
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    periodic_jobs = (
+        trending.refresh_trending_periodically(),
+        features.rebuild_event_features_periodically(),
+        recommend.refresh_recommendations_periodically(),
+    )
+    for periodic_job in periodic_jobs:
+        job = asyncio.create_task(periodic_job)
+        background_jobs.add(job)
+        job.add_done_callback(background_jobs.discard)
+
 
 @app.middleware("http")
 async def attach_db_session_to_context_var(request: Request, call_next):
-    with get_db() as session:
-        db.set(session)
+    # Only requests that call db.get() open a session, preflights and failed auth never reach the pool
+    lazy_session = LazySession()
+    db.set(lazy_session)
+    try:
         response = await call_next(request)
+        session = lazy_session.session
+        if session is None:
+            return response
+
+        # psycopg2 blocks so the commit, rollback and close run on the threadpool rather than the event loop
         if response.status_code >= 400:
-            session.rollback()
+            await run_in_threadpool(session.rollback)
         else:
-            session.commit()
+            await run_in_threadpool(session.commit)
         return response
+    finally:
+        if lazy_session.session is not None:
+            await run_in_threadpool(lazy_session.close)
 
 
 class ConnectionManager:
@@ -268,8 +297,10 @@ def get_followed_hosts(user: models.User = Depends(get_current_user)):
 
 
 @app.get("/profile/favourites", response_model=schemas.EventListingPreviewList)
-def get_favourites(user: models.User = Depends(get_current_user)):
+def get_favourites(stream: bool = False, user: models.User = Depends(get_current_user)):
     try:
+        if stream:
+            return favourites.get_user_favourites_stream(user)
         return favourites.get_user_favourites(user)
     except ForbiddenAccessException as e:
         raise HTTPException(status_code=e.code, detail=e.message)
@@ -281,9 +312,20 @@ def get_favourites(user: models.User = Depends(get_current_user)):
 
 
 @app.get("/host/{memberId}", response_model=schemas.HostPublicProfileInformation)
-def get_host_public_profile(memberId: int, user: models.User = Depends(get_user_or_none)):
+def get_host_public_profile(
+    memberId: int, request: Request, response: Response, user: models.User = Depends(get_user_or_none)
+):
+    # Any change to the host or one of their events bumps the host version
+    user_id = user.user_id if user else None
+    etag = http_cache.get_etag("host", memberId, host_profile.get_host_version(memberId), user_id)
     try:
-        host_info = host_profile.get_host_public_profile_info(memberId, user)
+        host_info = http_cache.get_conditional_response(
+            request,
+            response,
+            etag,
+            http_cache.get_cache_control(user),
+            lambda: host_profile.get_host_public_profile_info(memberId, user),
+        )
     except InvalidInputException as e:
         raise HTTPException(status_code=e.code, detail=e.message)
     except NotFoundException as e:
@@ -292,8 +334,10 @@ def get_host_public_profile(memberId: int, user: models.User = Depends(get_user_
 
 
 @app.post("/host/pastEvents/{host_id}", response_model=schemas.EventListingPreviewList)
-def get_past_host_events(host_id: int, sort: schemas.SortEventListings):
+def get_past_host_events(host_id: int, sort: schemas.SortEventListings, stream: bool = False):
     try:
+        if stream:
+            return host_profile.get_past_host_events_stream(host_id, sort.sort)
         return host_profile.get_past_host_events(host_id, sort.sort)
     except InvalidInputException as e:
         raise HTTPException(status_code=e.code, detail=e.message)
@@ -302,8 +346,10 @@ def get_past_host_events(host_id: int, sort: schemas.SortEventListings):
 
 
 @app.post("/host/currEvents/{host_id}", response_model=schemas.EventListingPreviewList)
-def get_current_host_events(host_id: int, sort: schemas.SortEventListings):
+def get_current_host_events(host_id: int, sort: schemas.SortEventListings, stream: bool = False):
     try:
+        if stream:
+            return host_profile.get_ongoing_host_events_stream(host_id, sort.sort)
         return host_profile.get_ongoing_host_events(host_id, sort.sort)
     except InvalidInputException as e:
         raise HTTPException(status_code=e.code, detail=e.message)
@@ -429,13 +475,26 @@ def update_event(event_id: int, updated_event: schemas.EventUpdate, user: models
 
 
 @app.get("/eventListing/{event_id}", response_model=schemas.EventDetails)
-def get_event_listing(event_id: int, user: models.User = Depends(get_user_or_none)):
+def get_event_listing(
+    event_id: int, request: Request, response: Response, user: models.User = Depends(get_user_or_none)
+):
     try:
-        event_details = event_listings.get_event_listing_details(event_id, user)
+        event_info = event_listings.get_event_info(event_id)
     except NotFoundException as e:
         raise HTTPException(status_code=e.code, detail=e.message)
 
-    return event_details
+    user_info = None if not user else event_listings.get_user_event_interactions(event_id, user.user_id)
+    trending.record_event_view(event_id)
+
+    # The event version, host and rating plus the user's own flags are everything the details are built from
+    etag = http_cache.get_etag("eventListing", tuple(event_info), user_info)
+    return http_cache.get_conditional_response(
+        request,
+        response,
+        etag,
+        http_cache.get_cache_control(user),
+        lambda: event_listings.build_event_listing_details(event_id, event_info, user_info),
+    )
 
 
 @app.delete("/eventListing/{event_id}", response_model=None)
@@ -452,16 +511,33 @@ def delete_event_listing(event_id: int, user: models.User = Depends(get_current_
         raise HTTPException(status_code=404, detail="Event not found")
 
 
+@app.get("/eventListing/{event_id}/alsoBooked", response_model=schemas.EventListingPreviewList)
+def get_also_booked_events(event_id: int, user: models.User = Depends(get_user_or_none)):
+    return recommend.get_also_booked_events(event_id)
+
+
 @app.get("/eventListing/{event_id}/userInfo", response_model=schemas.UserInfoEventListing)
-def get_event_user_info(event_id: int, user: models.User = Depends(get_user_or_none)):
-    try:
-        event_user_info = profile_db.get_user_event_interactions(event_id, user.user_id)
-    except Exception:
-        raise HTTPException(status_code=404, detail="User not found")
+def get_event_user_info(event_id: int, user: Union[models.User, None] = Depends(get_user_or_none)):
+    # Anonymous users get the default flags rather than a 401
+    event_user_info = event_listings.get_user_event_interactions(event_id, user.user_id if user else None)
+    if event_user_info is None:
+        raise HTTPException(status_code=404, detail="Event not found")
 
     return event_user_info
 
 
+@app.post("/eventListings/userInfo", response_model=schemas.UserInfoEventListings)
+def get_events_user_info(
+    request: schemas.UserInfoEventListingsRequest, user: Union[models.User, None] = Depends(get_user_or_none)
+):
+    try:
+        user_info = event_listings.get_user_events_interactions(request.eventListingIds, user.user_id if user else None)
+    except InvalidInputException as e:
+        raise HTTPException(status_code=e.code, detail=e.message)
+
+    return schemas.UserInfoEventListings(userInfo=user_info)
+
+
 @app.post("/eventListing/announcement")
 def send_announcements(announcement: schemas.Announcements, user: models.User = Depends(get_current_user)):
     try:
@@ -476,9 +552,12 @@ def send_announcements(announcement: schemas.Announcements, user: models.User =
 
 
 @app.get("/venue", response_model=schemas.Venues)
-def get_venues(user: models.User = Depends(get_current_user)):
+def get_venues(request: Request, response: Response, user: models.User = Depends(get_current_user)):
+    etag = http_cache.get_etag("venues", venue_db.get_venues_version())
     try:
-        venues = venue.get_all_venues()
+        venues = http_cache.get_conditional_response(
+            request, response, etag, constants.PRIVATE_CACHE_CONTROL, venue.get_all_venues
+        )
     except BadGatewayException as e:
         raise HTTPException(status_code=e.code, detail=e.message)
 
@@ -649,12 +728,26 @@ def easter_egg(start: Union[schemas.Start, int] = 0, user: Union[models.User, No
 
 
 @app.get("/trending", response_model=schemas.EventListingPreviewList)
-async def get_trending():
-    return recommend.get_trending_generic_events()
+async def get_trending(request: Request, response: Response):
+    return await run_with_db(
+        lambda: http_cache.get_conditional_response(
+            request,
+            response,
+            http_cache.get_etag("trending", recommend.get_trending_generic_versions()),
+            constants.TRENDING_CACHE_CONTROL,
+            recommend.get_trending_generic_events,
+        )
+    )
 
 
 @app.get("/allEvents", response_model=schemas.EventListingPreviewList)
-def get_all_events(user: Union[models.User, None] = Depends(authenticate.get_user_or_none)):
+def get_all_events(stream: bool = False, user: Union[models.User, None] = Depends(authenticate.get_user_or_none)):
+    # Newline delimited previews as they are read rather than one document
+    if stream and (not user or user.user_type == constants.HOST):
+        return recommend.get_all_generic_stream()
+    elif stream:
+        return recommend.get_all_recommended_stream(user.user_id)
+
     if not user or user.user_type == constants.HOST:
         return recommend.get_all_generic_events()
     else:
@@ -663,12 +756,20 @@ def get_all_events(user: Union[models.User, None] = Depends(authenticate.get_use
 
 @app.get("/trendingEvents/{tag}", response_model=schemas.EventListingPreviewList)
 def get_trending_events(tag: str, user: Union[models.User, None] = Depends(authenticate.get_user_or_none)):
-    return recommend.get_trending_generic_events(tag)
+    return recommend.get_trending_tag_events(tag)
 
 
 @app.get("/allTags", response_model=schemas.Tags)
-def get_all_tags(user: Union[models.User, None] = Depends(authenticate.get_user_or_none)):
-    return recommend.get_all_tags()
+def get_all_tags(
+    request: Request,
+    response: Response,
+    order: constants.TagOrder = constants.TagOrder.NAME,
+    user: Union[models.User, None] = Depends(authenticate.get_user_or_none),
+):
+    etag = http_cache.get_etag("tags", order.value, trending.get_tag_index().etag)
+    return http_cache.get_conditional_response(
+        request, response, etag, constants.PUBLIC_CACHE_CONTROL, lambda: recommend.get_all_tags(order)
+    )
 
 
 @app.post("/search", response_model=schemas.EventListingPreviewList)
@@ -684,13 +785,21 @@ def search_events(
         raise HTTPException(status_code=403, detail=e.message)
 
 
+@app.get("/search/suggest", response_model=schemas.SearchSuggestions)
+def get_search_suggestions(q: str = ""):
+    try:
+        return suggest.get_suggestions(q)
+    except InvalidInputException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+
+
 @app.post("/allEventsByCoord", response_model=schemas.EventListingPreviewList)
 def search_events_by_coord(
     criteria: schemas.eventCoord, user: Union[models.User, None] = Depends(authenticate.get_user_or_none)
 ):
     try:
         criteria = schemas.sortFilterEventListings(
-            searchQuery="", start=0, locationCoord=criteria.locationCoord, sort=""
+            searchQuery="", locationCoord=criteria.locationCoord, cursor=criteria.cursor, sort=""
         )
         if not user or user.user_type == constants.HOST:
             return search.run_search_query(criteria)
@@ -700,6 +809,14 @@ def search_events_by_coord(
         raise HTTPException(status_code=403, detail=e.message)
 
 
+@app.post("/map/clusters", response_model=schemas.MapClusterList)
+def get_map_clusters(viewport: schemas.MapViewport):
+    try:
+        return map_clusters.get_map_clusters(viewport)
+    except InvalidInputException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+
+
 # -------------------------------------------------------------------------------------------------------------------- #
 # --------------------------------------------------- Socials -------------------------------------------------------- #
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -730,7 +847,7 @@ def post_favourites(event_id: int, user: models.User = Depends(get_current_user)
 @app.put("/follow/{hostId}", response_model=None)
 async def follow_host(hostId: int, user: models.User = Depends(get_current_user)):
     try:
-        follow.follow_unfollow_host(hostId, user)
+        await run_with_db(follow.follow_unfollow_host, hostId, user)
         await update_follow_count(hostId)
     except InvalidInputException as e:
         raise HTTPException(status_code=400, detail=e.message)
@@ -762,8 +879,20 @@ def host_reply_to_review(response: schemas.HostRepliesReview, user: models.User
 
 
 @app.get("/eventListing/review/{event_id}", response_model=schemas.AllReviewsWithDetail)
-async def get_event_reviews(event_id: int, user: models.User = Depends(get_user_or_none)):
-    return reviews_db.get_event_reviews(event_id, user)
+async def get_event_reviews(
+    event_id: int, request: Request, response: Response, user: models.User = Depends(get_user_or_none)
+):
+    # Reviews, replies and review likes all bump the event version
+    user_id = user.user_id if user else None
+    return await run_with_db(
+        lambda: http_cache.get_conditional_response(
+            request,
+            response,
+            http_cache.get_etag("reviews", event_id, event_listings.get_event_version(event_id), user_id),
+            http_cache.get_cache_control(user),
+            lambda: reviews_db.get_event_reviews(event_id, user),
+        )
+    )
 
 
 @app.put("/review/{reviewId}", response_model=None)
@@ -781,7 +910,7 @@ def update_review(reviewId: int, review_detail: schemas.UpdateReview, user: mode
 @app.post("/review/like/{reviewId}", response_model=None)
 async def liking_review(reviewId: int, user: models.User = Depends(get_current_user)):
     try:
-        reviews_db.like_reviews(reviewId, user.user_id)
+        await run_with_db(reviews_db.like_reviews, reviewId, user.user_id)
     except InvalidInputException as e:
         raise HTTPException(status_code=400, detail=e.message)
 
@@ -791,7 +920,7 @@ async def liking_review(reviewId: int, user: models.User = Depends(get_current_u
 @app.post("/review/dislike/{reviewId}", response_model=None)
 async def disliking_review(reviewId: int, user: models.User = Depends(get_current_user)):
     try:
-        reviews_db.dislike_reviews(reviewId)
+        await run_with_db(reviews_db.dislike_reviews, reviewId)
     except InvalidInputException as e:
         raise HTTPException(status_code=400, detail=e.message)
 
@@ -868,7 +997,6 @@ def get_chat_info(user: models.User = Depends(get_current_user)):
 
 @app.websocket("/ws/{event_id}")
 async def websocket_endpoint(websocket: WebSocket, event_id: int):
-    db_session = SessionLocal()
     await manager.connect(websocket, event_id)
     try:
         while True:
@@ -877,16 +1005,16 @@ async def websocket_endpoint(websocket: WebSocket, event_id: int):
             if "type" in data.keys() and data["type"] == "connect":
                 pass
             else:
-                error = messages.update_chat(schemas.CreateChatMessage.parse_obj(data), db_session)
+                # Each message gets its own session so an idle socket holds no connection
+                message = schemas.CreateChatMessage.parse_obj(data)
+                error = await run_with_db(lambda: messages.update_chat(message, db.get()))
                 await manager.broadcast(json.dumps(error), event_id)
-            db_session.commit()
     except WebSocketDisconnect:
         manager.disconnect(websocket)
-        db_session.close()
 
 
 async def update_follow_count(host_id: int):
-    curr_follower_count = messages.live_follower_count(host_id, db.get())
+    curr_follower_count = await run_with_db(lambda: messages.live_follower_count(host_id, db.get()))
     await count_manager.broadcast(json.dumps(curr_follower_count), host_id)
 
 
@@ -903,6 +1031,20 @@ async def websocket_count_endpoint(websocket: WebSocket, host_id: int):
         count_manager.disconnect(websocket)
 
 
+@app.websocket("/ws/tickets/{event_id}")
+async def websocket_tickets_endpoint(websocket: WebSocket, event_id: int):
+    # Pushes the tickets left in every reserve and section when bookings or cancellations commit
+    try:
+        await ticket_availability.watch(websocket, event_id)
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Drops, failed sends and any other error must not leave the socket in the channel
+        ticket_availability.unwatch(websocket, event_id)
+
+
 # -------------------------------------------------------------------------------------------------------------------- #
 # ------------------------------------------------- Surveys ------------------------------------------------------- #
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -915,7 +1057,7 @@ async def new_survey(
     user: models.User = Depends(get_current_user),
 ):
     try:
-        create_surveys.new_survey(survey_details, user, background_tasks)
+        await run_with_db(create_surveys.new_survey, survey_details, user, background_tasks)
     except InvalidInputException as e:
         raise HTTPException(status_code=400, detail=str(e))
     except ForbiddenAccessException as e:
@@ -925,7 +1067,7 @@ async def new_survey(
 @app.delete("/survey/{event_id}", response_model=None)
 async def delete_survey(event_id: int, user: models.User = Depends(get_current_user)):
     try:
-        delete_surveys.remove_survey(event_id, user)
+        await run_with_db(delete_surveys.remove_survey, event_id, user)
     except InvalidInputException as e:
         raise HTTPException(status_code=400, detail=str(e))
     except ForbiddenAccessException as e:
@@ -935,7 +1077,7 @@ async def delete_survey(event_id: int, user: models.User = Depends(get_current_u
 @app.get("/survey/{event_id}", response_model=schemas.ListGetSurvey)
 async def get_survey(event_id: int, user: models.User = Depends(get_current_user)):
     try:
-        survey_obj = get_surveys.get_survey(event_id, user)
+        survey_obj = await run_with_db(get_surveys.get_survey, event_id, user)
     except ForbiddenAccessException as e:
         raise HTTPException(status_code=403, detail=str(e))
     except InvalidInputException as e:
@@ -947,7 +1089,7 @@ async def get_survey(event_id: int, user: models.User = Depends(get_current_user
 @app.post("/survey/submit", response_model=None)
 async def submit_survey(customer_answer: schemas.SurveySubmit, user: models.User = Depends(get_current_user)):
     try:
-        submit_surveys.send_survey(customer_answer, user)
+        await run_with_db(submit_surveys.send_survey, customer_answer, user)
     except ForbiddenAccessException as e:
         raise HTTPException(status_code=403, detail=str(e))
     except InvalidRequestException as e:
@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Index, Text, Numeric, TIMESTAMP, Date, ARRAY
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Index, Text, Numeric, TIMESTAMP, Date, ARRAY, Float
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, DDL, event
 
+from . import constants
 from .database import Base
 
 """
@@ -9,6 +12,9 @@ Notes: can use lazy='dynamic' set on relationships to allow for additional
 filtering. 
 """
 
+# Trigram indexes used by the search suggestions need the pg_trgm extension
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
 # ---------------------------------------------------------------------------------- #
 # ---------------------------------- User Accounts --------------------------------- #
 
@@ -70,6 +76,10 @@ class Host(User):
     num_followers = Column(Integer, default=0)
     rating = Column(Numeric(10, 2), default=0)
     num_events = Column(Integer, default=0)
+    # Kept by triggers on event_reviews, rating_counts holds the number of reviews with each rating from 0 up
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_counts = Column(ARRAY(Integer), nullable=False, default=lambda: [0] * (constants.MAX_RATING + 1))
 
     # relationships
     user = relationship("User", back_populates="host")
@@ -82,6 +92,9 @@ class Host(User):
     daily_sales_data = relationship("HostDailySales", lazy="dynamic", back_populates="host")
 
     __mapper_args__ = {"polymorphic_identity": "host"}
+    __table_args__ = (
+        Index("ix_hosts_org_name_trgm", org_name, postgresql_using="gin", postgresql_ops={"org_name": "gin_trgm_ops"}),
+    )
 
 
 class Follower(Base):
@@ -95,6 +108,22 @@ class Follower(Base):
     customer = relationship("Customer", back_populates="followed_hosts")
 
 
+# Bumped by the triggers in database/triggers.sql on any write to a host or one of their events
+class HostVersion(Base):
+    __tablename__ = "host_versions"
+
+    host_id = Column(Integer, ForeignKey("hosts.host_id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# Bumped by the triggers in database/triggers.sql on any write to a listing served whole, such as all venues
+class ContentVersion(Base):
+    __tablename__ = "content_versions"
+
+    name = Column(String(255), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
 # ----------------------------------------------------------------------------------- #
 # ----------------------------------- Venues ---------------------------------------- #
 
@@ -107,11 +136,15 @@ class Venue(Base):
     name = Column(String(255), nullable=False)
     location = Column(String(255), nullable=False)
     location_coords = Column(String, nullable=False)
+    latitude = Column(Float)
+    longitude = Column(Float)
 
     # Define relationships
     media = relationship("VenueMedia", lazy="dynamic")
     venue_sections = relationship("VenueSection", back_populates="venue")
 
+    __table_args__ = (Index("ix_venues_coordinates", latitude, longitude),)
+
 
 # Venue sections table
 class VenueSection(Base):
@@ -170,6 +203,10 @@ class Event(Base):
     cancelled = Column(Boolean, default=False)
     thumbnail = Column(Text)
     survey_made = Column(Boolean, default=False)
+    # Kept by triggers on event_reviews, rating_counts holds the number of reviews with each rating from 0 up
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_counts = Column(ARRAY(Integer), nullable=False, default=lambda: [0] * (constants.MAX_RATING + 1))
 
     # relationships
     host = relationship("Host", uselist=False, back_populates="events")
@@ -210,6 +247,18 @@ class NotSeatedEvent(Base):
     not_seated_event_id = Column(Integer, ForeignKey("events.event_id"), primary_key=True)
     location = Column(String(255), nullable=False)
     location_coords = Column(String, nullable=False)
+    latitude = Column(Float)
+    longitude = Column(Float)
+
+    __table_args__ = (Index("ix_not_seated_events_coordinates", latitude, longitude),)
+
+
+# Bumped by the triggers in database/triggers.sql on any write to an event or its details
+class EventVersion(Base):
+    __tablename__ = "event_versions"
+
+    event_id = Column(Integer, ForeignKey("events.event_id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
 
 
 # --------------------------------------------------------------------------------------- #
@@ -255,6 +304,10 @@ class Tag(Base):
 
     events = relationship("EventTag", back_populates="tag")
 
+    __table_args__ = (
+        Index("ix_tags_tag_name_trgm", tag_name, postgresql_using="gin", postgresql_ops={"tag_name": "gin_trgm_ops"}),
+    )
+
 
 class EventTag(Base):
     __tablename__ = "event_tags"
@@ -265,6 +318,44 @@ class EventTag(Base):
     tag = relationship("Tag", uselist=False, back_populates="events")
 
 
+# --------------------------------------------------------------------------------------- #
+# --------------------------------- Events - Search ------------------------------------- #
+
+
+# One row per event, maintained by the event search triggers in database/triggers.sql
+class EventSearchDocument(Base):
+    __tablename__ = "event_search_documents"
+
+    event_id = Column(Integer, ForeignKey("events.event_id", ondelete="CASCADE"), primary_key=True)
+    host_id = Column(Integer, ForeignKey("hosts.host_id"))
+    org_name = Column(String(255))
+    num_followers = Column(Integer, default=0)
+    host_rating = Column(Numeric(10, 2), default=0)
+    title = Column(String(255), nullable=False)
+    thumbnail = Column(Text)
+    event_type = Column(String(100), nullable=False)
+    start_time = Column(TIMESTAMP, nullable=False)
+    end_time = Column(TIMESTAMP, nullable=False)
+    minimum_cost = Column(Numeric(10, 2), default=0)
+    likes = Column(Integer, default=0)
+    cancelled = Column(Boolean, default=False)
+    location = Column(String(255))
+    latitude = Column(Float)
+    longitude = Column(Float)
+    tags = Column(postgresql.ARRAY(String), nullable=False, default=[])
+    search_vector = Column(TSVECTOR)
+
+    __table_args__ = (
+        Index("ix_event_search_documents_search_vector", search_vector, postgresql_using="gin"),
+        Index("ix_event_search_documents_tags", tags, postgresql_using="gin"),
+        Index(
+            "ix_event_search_documents_title_trgm", title, postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}
+        ),
+        Index("ix_event_search_documents_coordinates", latitude, longitude),
+        Index("ix_event_search_documents_end_time", end_time),
+    )
+
+
 # --------------------------------------------------------------------------------------- #
 # ------------------------------ Events - User Input ------------------------------------ #
 
@@ -561,3 +652,46 @@ class HostDailySales(Base):
     sales = Column(Numeric(10, 2), default=0)
 
     host = relationship("Host", uselist=False, back_populates="daily_sales_data")
+
+
+# Daily likes, bookings and views of each event, used to rank trending events
+class EventActivityLog(Base):
+    __tablename__ = "event_activity_log"
+
+    event_id = Column(Integer, ForeignKey("events.event_id", ondelete="CASCADE"), primary_key=True)
+    date = Column(Date, nullable=False, primary_key=True)
+    likes = Column(Integer, default=0)
+    bookings = Column(Integer, default=0)
+    views = Column(Integer, default=0)
+
+    __table_args__ = (Index("ix_event_activity_log_date", date),)
+
+
+# --------------------------------------------------------------------------------------- #
+# ---------------------------------- Recommendations ------------------------------------ #
+
+
+# Top recommended events per customer, refreshed by the job in app.search.recommend after their own writes
+class UserRecommendation(Base):
+    __tablename__ = "user_recommendations"
+
+    customer_id = Column(Integer, ForeignKey("customers.customer_id"), primary_key=True)
+    event_id = Column(Integer, ForeignKey("events.event_id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    # newest event merged into the list, the periodic job merges newer events in
+    latest_event_id = Column(Integer, nullable=False)
+
+    __table_args__ = (Index("ix_user_recommendations_rank", customer_id, rank),)
+
+
+# Most similar events by customers who booked, liked or favourited both, built by app.search.neighbours
+class EventNeighbour(Base):
+    __tablename__ = "event_neighbours"
+
+    event_id = Column(Integer, ForeignKey("events.event_id", ondelete="CASCADE"), primary_key=True)
+    neighbour_id = Column(Integer, ForeignKey("events.event_id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_event_neighbours_rank", event_id, rank),)
@@ -1,9 +1,11 @@
 import pydantic
-from sqlalchemy import func, or_
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, or_, select
 
 from .. import models, schemas, exceptions, constants
+from ..database import db
 from ..socials import socials_db, reviews_db
-from ..events import event_preview
+from ..events import event_preview, event_stream
 from ..auth import auth_db
 from ..search import sort_filter
 
@@ -17,7 +19,11 @@ def get_host_public_profile_info(host_id: int, user: models.User = None) -> sche
     host = get_host(host_id)
 
     user_id = user.user_id if user else None
-    reviews = [reviews_db.get_review_details_with_event_preview(review, user_id) for review in host.reviews]
+    event_previews = event_preview.get_event_previews_by_id([review.event_id for review in host.reviews])
+    reviews = [
+        reviews_db.get_review_details_with_event_preview(review, user_id, event_previews.get(review.event_id))
+        for review in host.reviews
+    ]
     userInfo = None if not user else schemas.FollowsHost(followsHost=socials_db.user_follows_host(host.host_id, user.user_id))
 
     return schemas.HostPublicProfileInformation(
@@ -30,6 +36,7 @@ def get_host_public_profile_info(host_id: int, user: models.User = None) -> sche
         noFollowers=host.num_followers,
         rating=host.rating,
         noEvents=host.num_events,
+        ratingCounts=host.rating_counts,
     )
 
 
@@ -41,23 +48,37 @@ def get_host(member_id: int) -> models.Host:
     return base_user.host
 
 
+def get_host_version(host_id: int) -> int:
+    version = db.get().query(models.HostVersion.version).filter(models.HostVersion.host_id == host_id).scalar()
+    return version or 0
+
+
 # ---------------------------------------------------------------------------------------------------- #
 # ---------------------------------------  Host Events  ---------------------------------------------- #
 
 
-def get_past_host_events(host_id: int, sort: str = None) -> schemas.EventListingPreviewList:
-
+def get_host_events_query(host_id: int, sort: str, *filters):
+    # Built up front with the host id bound so the stream can run it after the request session closes
     host = get_host(host_id)
 
     sort = sort_filter.get_event_sort(sort, original_titles=True)
+    return select(models.Event.event_id).where(models.Event.host_id == host.host_id, *filters).order_by(sort)
+
+
+def get_past_host_events_query(host_id: int, sort: str = None):
+    finished = or_(models.Event.cancelled.is_(True), models.Event.end_time < func.now())
+    return get_host_events_query(host_id, sort, finished)
+
+
+def get_ongoing_host_events_query(host_id: int, sort: str = None):
+    return get_host_events_query(host_id, sort, models.Event.cancelled.is_(False), models.Event.end_time >= func.now())
+
+
+def get_past_host_events(host_id: int, sort: str = None) -> schemas.EventListingPreviewList:
+    past_events = get_past_host_events_query(host_id, sort)
     try:
-        past_events = (
-            host.events.filter(or_(models.Event.cancelled.is_(True), models.Event.end_time < func.now()))
-            .order_by(sort)
-            .all()
-        )
         return schemas.EventListingPreviewList(
-            eventListings=[event_preview.get_event_preview(event) for event in past_events]
+            eventListings=event_preview.get_event_previews(db.get().execute(past_events).scalars().all())
         )
 
     except pydantic.error_wrappers.ValidationError:
@@ -65,24 +86,22 @@ def get_past_host_events(host_id: int, sort: str = None) -> schemas.EventListing
 
 
 def get_ongoing_host_events(host_id: int, sort: str = None) -> schemas.EventListingPreviewList:
-
-    host = get_host(host_id)
-
-    sort = sort_filter.get_event_sort(sort, original_titles=True)
-
+    ongoing_events = get_ongoing_host_events_query(host_id, sort)
     try:
-        ongoing_events = (
-            host.events
-            .filter(models.Event.cancelled.is_(False), models.Event.end_time >= func.now())
-            .order_by(sort)
-            .all()
-        )
         return schemas.EventListingPreviewList(
-            eventListings=[
-                event_preview.get_event_preview(event)
-                for event in ongoing_events
-            ]
+            eventListings=event_preview.get_event_previews(db.get().execute(ongoing_events).scalars().all())
         )
 
     except pydantic.error_wrappers.ValidationError:
         raise exceptions.InternalServerError("Host has missing fields.")
+
+
+def get_past_host_events_stream(host_id: int, sort: str = None) -> StreamingResponse:
+    # The query is built now so a bad host or sort fails before the response starts, it runs as the stream reads
+    query = get_past_host_events_query(host_id, sort)
+    return event_stream.get_preview_stream(event_stream.get_streamed_ids(query))
+
+
+def get_ongoing_host_events_stream(host_id: int, sort: str = None) -> StreamingResponse:
+    query = get_ongoing_host_events_query(host_id, sort)
+    return event_stream.get_preview_stream(event_stream.get_streamed_ids(query))
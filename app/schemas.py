@@ -257,6 +257,8 @@ class Venues(BaseModel):
 
 class Tags(BaseModel):
     tags: List[str]
+    # Number of upcoming events with each tag
+    eventCounts: Optional[Dict[str, int]] = Field(default_factory=dict)
 
 
 class EventId(BaseModel):
@@ -321,6 +323,15 @@ class UserInfoEventListing(BaseModel):
     hasReviewed: bool
 
 
+class UserInfoEventListingsRequest(BaseModel):
+    eventListingIds: List[int]
+
+
+class UserInfoEventListings(BaseModel):
+    # Keyed by event listing id
+    userInfo: Dict[int, UserInfoEventListing]
+
+
 class Announcements(BaseModel):
     eventListingId: Optional[int]
     title: custom_types.RequiredShortStr
@@ -335,6 +346,8 @@ class EventDetails(BaseModel):
     type: custom_types.EventType
     editable: bool
     averageRating: Optional[float]
+    # Number of reviews with each rating from 0 up
+    ratingCounts: List[int] = []
     cancelled: bool
     eventListingId: Optional[int]
     memberId: int
@@ -374,8 +387,23 @@ class EventListingPreview(BaseModel):
     type: custom_types.EventType
 
 
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+
+class SearchFacets(BaseModel):
+    type: List[FacetCount]
+    tags: List[FacetCount]
+    price: List[FacetCount]
+    date: List[FacetCount]
+
+
 class EventListingPreviewList(BaseModel):
     eventListings: List[EventListingPreview]
+    hasMore: Optional[bool] = None
+    nextCursor: Optional[str] = None
+    facets: Optional[SearchFacets] = None
 
 
 class EventUpdate(BaseModel):
@@ -408,10 +436,13 @@ class FilterListings(BaseModel):
 
 class sortFilterEventListings(BaseModel):
     searchQuery: Optional[custom_types.SearchString]
-    start: custom_types.PostiveInt
+    # Only 0 is accepted, later pages are reached with the cursor
+    start: Optional[custom_types.PostiveInt] = 0
+    cursor: Optional[str] = None
     locationCoord: Optional[custom_types.ShortString]
     filter: Optional[FilterListings]
     sort: Optional[custom_types.ShortString]
+    facets: Optional[bool] = False
 
 
 class SortEventListings(BaseModel):
@@ -420,6 +451,35 @@ class SortEventListings(BaseModel):
 
 class eventCoord(BaseModel):
     locationCoord: custom_types.ShortString
+    cursor: Optional[str] = None
+
+
+class SearchSuggestion(BaseModel):
+    text: str
+    type: str
+
+
+class SearchSuggestions(BaseModel):
+    suggestions: List[SearchSuggestion]
+
+
+class MapViewport(BaseModel):
+    north: float
+    south: float
+    east: float
+    west: float
+    zoom: int
+
+
+class MapCluster(BaseModel):
+    count: int
+    latitude: float
+    longitude: float
+    eventListingIds: List[int]
+
+
+class MapClusterList(BaseModel):
+    clusters: List[MapCluster]
 
 
 class EventReact(BaseModel):
@@ -499,6 +559,8 @@ class HostPublicProfileInformation(BaseModel):
     noFollowers: custom_types.PostiveInt
     rating: Optional[custom_types.Rating]
     noEvents: custom_types.PostiveInt
+    # Number of reviews of the host's events with each rating from 0 up
+    ratingCounts: List[int] = []
 
 
 # ------------------------------------------------------------------------------------------------- #
@@ -535,6 +597,24 @@ class PreBookingInfo(BaseModel):
     eventInfo: EventListingPreview
 
 
+class ReserveTicketsLeft(BaseModel):
+    reserveName: str
+    ticketsLeft: int
+
+
+class SectionTicketsLeft(BaseModel):
+    sectionName: str
+    reserve: str
+    ticketsLeft: int
+
+
+class TicketAvailability(BaseModel):
+    # Every reserve and section when a watcher connects, then only those that changed
+    eventListingId: int
+    reserves: List[ReserveTicketsLeft]
+    sections: List[SectionTicketsLeft]
+
+
 # ------------------------------------------------------------------------------------------------- #
 # ----------------------------------------- Booking ----------------------------------------------- #
 # ------------------------------------------------------------------------------------------------- #
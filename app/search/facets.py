@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from typing import List
+from sqlalchemy import select, func, case, true
+
+from .. import models, schemas, constants
+from ..database import db
+
+
+FACET_NAMES = ("type", "tags", "price", "date")
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# --------------------------------------------  Buckets  --------------------------------------------- #
+
+
+def get_price_bucket(minimum_cost):
+    # Free events, then one bucket between each boundary and an open ended final bucket
+    minimum_cost = func.coalesce(minimum_cost, 0)
+    boundaries = constants.SEARCH_PRICE_BUCKETS
+    whens = [(minimum_cost <= 0, "free")]
+    for lower, upper in zip((0,) + boundaries, boundaries):
+        whens.append((minimum_cost < upper, f"{lower}-{upper}"))
+    return case(*whens, else_=f"{boundaries[-1]}+")
+
+
+def get_date_bucket(start_time):
+    # Days are counted from the start of today so "today" ends at midnight
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    whens = [(start_time < today + timedelta(days=days), label) for label, days in constants.SEARCH_DATE_BUCKETS]
+    return case(*whens, else_="later")
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# --------------------------------------------  Facets  ---------------------------------------------- #
+
+
+def get_facet_counts(results, facet_name: str) -> List[schemas.FacetCount]:
+    facet_results = [result for result in results if result.facet == facet_name]
+    facet_results.sort(key=lambda result: (-result.count, result.value))
+    return [schemas.FacetCount(value=result.value, count=result.count) for result in facet_results]
+
+
+def get_search_facets(filters: List) -> schemas.SearchFacets:
+    document = models.EventSearchDocument
+    filtered = (
+        select(
+            document.event_id.label("eventId"),
+            document.event_type.label("type"),
+            document.tags.label("tags"),
+            get_price_bucket(document.minimum_cost).label("price"),
+            get_date_bucket(document.start_time).label("date"),
+        )
+        .filter(*filters)
+        .cte("filtered")
+    )
+    tag = func.unnest(filtered.c.tags).table_valued("tag").render_derived().lateral("event_tag")
+
+    # Count every facet in one pass, events are counted once per tag so distinct ids are needed
+    facets = [filtered.c.type, tag.c.tag, filtered.c.price, filtered.c.date]
+    facet_rows = (
+        select(
+            case(*[(func.grouping(column) == 0, column) for column in facets]).label("value"),
+            case(*[(func.grouping(column) == 0, name) for column, name in zip(facets, FACET_NAMES)]).label("facet"),
+            func.count(filtered.c.eventId.distinct()).label("count"),
+        )
+        .select_from(filtered)
+        .join(tag, true(), isouter=True)
+        .group_by(func.grouping_sets(*facets))
+    )
+
+    results = [result for result in db.get().execute(facet_rows).fetchall() if result.value is not None]
+    return schemas.SearchFacets(**{facet_name: get_facet_counts(results, facet_name) for facet_name in FACET_NAMES})
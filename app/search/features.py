@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .. import models, constants
+from ..database import db, get_db
+
+
+logger = logging.getLogger(__name__)
+
+# Hashed feature indices of a text and their sublinear term frequencies
+TermVector = Tuple[np.ndarray, np.ndarray]
+
+TITLE, DESCRIPTION = 0, 1
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ------------------------------------------  Vectorizing  ------------------------------------------- #
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in re.findall(r"[a-z0-9]+", (text or "").lower()) if len(token) > 1]
+
+
+def get_feature_index(token: str) -> int:
+    # crc32 is stable across processes unlike the builtin string hash
+    return zlib.crc32(token.encode()) % constants.EVENT_FEATURE_DIMENSIONS
+
+
+def get_term_vector(text: str) -> TermVector:
+    indices = np.array([get_feature_index(token) for token in tokenize(text)], dtype=np.int64)
+    indices, counts = np.unique(indices, return_counts=True)
+
+    # Sublinear term frequency so repeated words do not dominate
+    return indices, (1 + np.log(counts)).astype(np.float32)
+
+
+def get_tfidf_matrix(vectors: List[TermVector], idf: np.ndarray) -> sparse.csr_matrix:
+    """
+    Term vectors weighted by inverse document frequency, each row is
+    l2 normalised so the dot product of two rows is their cosine similarity
+    """
+    indptr = np.cumsum([0] + [len(indices) for indices, _ in vectors])
+    indices = np.concatenate([indices for indices, _ in vectors]) if vectors else np.zeros(0, dtype=np.int64)
+    data = np.concatenate([data for _, data in vectors]) if vectors else np.zeros(0, dtype=np.float32)
+
+    tfidf = sparse.csr_matrix(
+        (data * idf[indices], indices, indptr), shape=(len(vectors), constants.EVENT_FEATURE_DIMENSIONS)
+    )
+    norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms).dot(tfidf).tocsr()
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ---------------------------------------  Event Features  ------------------------------------------- #
+
+
+class EventFeatures:
+    """
+    The title and description term vectors of every event with their document frequencies, an event's
+    vectors are replaced when it is written so the index is never rebuilt on a request
+    """
+
+    def __init__(self):
+        self.vectors: Dict[int, Tuple[TermVector, TermVector]] = {}
+        self.document_frequency = [
+            np.zeros(constants.EVENT_FEATURE_DIMENSIONS, dtype=np.int64) for _ in (TITLE, DESCRIPTION)
+        ]
+        self.idf: Optional[List[np.ndarray]] = None
+        self.lock = threading.Lock()
+
+    def set_event(self, event_id: int, title: str, description: str):
+        vectors = (get_term_vector(title), get_term_vector(description))
+        with self.lock:
+            self._remove_event(event_id)
+            self.vectors[event_id] = vectors
+            for field, (indices, _) in enumerate(vectors):
+                self.document_frequency[field][indices] += 1
+            self.idf = None
+
+    def remove_event(self, event_id: int):
+        with self.lock:
+            self._remove_event(event_id)
+            self.idf = None
+
+    def _remove_event(self, event_id: int):
+        vectors = self.vectors.pop(event_id, None)
+        if vectors is None:
+            return
+        for field, (indices, _) in enumerate(vectors):
+            self.document_frequency[field][indices] -= 1
+
+    def get_idf(self) -> List[np.ndarray]:
+        # Only recalculated on the first similarity after a write
+        if self.idf is None:
+            events = len(self.vectors)
+            self.idf = [
+                (np.log((1 + events) / (1 + document_frequency)) + 1).astype(np.float32)
+                for document_frequency in self.document_frequency
+            ]
+        return self.idf
+
+    def get_max_similarity(self, candidate_ids: List[int], past_ids: List[int]) -> np.ndarray:
+        """
+        Highest title or description cosine similarity of each candidate to any of the past events
+        """
+        similarity = np.zeros(len(candidate_ids), dtype=np.float32)
+        with self.lock:
+            idf = self.get_idf()
+            past = [self.vectors[event_id] for event_id in past_ids if event_id in self.vectors]
+            known = np.array([event_id in self.vectors for event_id in candidate_ids], dtype=bool)
+            candidates = [self.vectors[event_id] for event_id in candidate_ids if event_id in self.vectors]
+        if not candidates or not past:
+            return similarity
+
+        # Candidates missing from the index keep a similarity of 0
+        for field in (TITLE, DESCRIPTION):
+            candidate_matrix = get_tfidf_matrix([vectors[field] for vectors in candidates], idf[field])
+            past_matrix = get_tfidf_matrix([vectors[field] for vectors in past], idf[field])
+            scores = candidate_matrix.dot(past_matrix.T)
+            similarity[known] = np.maximum(similarity[known], scores.max(axis=1).toarray().ravel())
+
+        return similarity
+
+
+event_features: Optional[EventFeatures] = None
+event_features_lock = threading.Lock()
+
+
+def build_event_features() -> EventFeatures:
+    features = EventFeatures()
+    events = db.get().query(models.Event.event_id, models.Event.title, models.Event.description).all()
+    for item in events:
+        features.set_event(item.event_id, item.title, item.description)
+    return features
+
+
+def get_event_features() -> EventFeatures:
+    # Only built here on the first recommendation, writes and the periodic job keep it current after that
+    global event_features
+    with event_features_lock:
+        if event_features is None:
+            event_features = build_event_features()
+    return event_features
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ------------------------------------  Write Notification  ------------------------------------------ #
+
+
+@event.listens_for(Session, "after_flush")
+def _track_written_events(session: Session, flush_context):
+    # Only events whose text changed need new vectors, likes and ratings do not touch them
+    written = session.info.setdefault("feature_events", {})
+    for instance in (*session.new, *session.dirty):
+        if not isinstance(instance, models.Event):
+            continue
+        state = inspect(instance)
+        if instance in session.new or any(state.attrs[name].history.has_changes() for name in ("title", "description")):
+            written[instance.event_id] = (instance.title, instance.description)
+    for instance in session.deleted:
+        if isinstance(instance, models.Event):
+            written[instance.event_id] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _update_written_events(session: Session):
+    written = session.info.pop("feature_events", {})
+    if not written or event_features is None:
+        return
+
+    for event_id, text in written.items():
+        if text is None:
+            event_features.remove_event(event_id)
+        else:
+            event_features.set_event(event_id, *text)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_written_events(session: Session):
+    session.info.pop("feature_events", None)
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ------------------------------------------  Periodic Job  ------------------------------------------ #
+
+
+def run_event_features_job():
+    # Picks up events written by other workers or outside the ORM, the old index serves until it is swapped
+    global event_features
+    with get_db() as session:
+        db.set(session)
+        features = build_event_features()
+    with event_features_lock:
+        event_features = features
+
+
+async def rebuild_event_features_periodically():
+    while True:
+        await asyncio.sleep(constants.EVENT_FEATURES_REBUILD_SECONDS)
+        try:
+            await run_in_threadpool(run_event_features_job)
+        except Exception:
+            logger.exception("Failed to rebuild the event features")
@@ -0,0 +1,168 @@
+import math
+from datetime import datetime
+from typing import Dict, List, Tuple
+from sqlalchemy import select, func, or_, Integer
+from sqlalchemy.sql import between
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+
+from .. import models, schemas, constants
+from ..cache import TTLCache, clear_on_write
+from ..database import db
+from ..exceptions import InvalidInputException
+
+
+# Clusters of each tile keyed by (zoom, tile x, tile y)
+tile_cache = TTLCache(max_size=constants.MAP_TILE_CACHE_SIZE, ttl=constants.MAP_TILE_CACHE_SECONDS)
+clear_on_write(tile_cache, models.Event, models.SeatedEvent, models.NotSeatedEvent, models.Venue, models.Like)
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# -------------------------------------------  Tile Grid  -------------------------------------------- #
+
+
+def get_tile_size(zoom: int) -> float:
+    # Tiles are square in degrees and halve in size with every zoom level
+    return 360 / 2 ** zoom
+
+
+def get_tile_index(coordinate: float, offset: int, tile_size: float, num_tiles: int) -> int:
+    return min(int((coordinate + offset) // tile_size), num_tiles - 1)
+
+
+def validate_viewport(viewport: schemas.MapViewport):
+    if not 0 <= viewport.zoom <= constants.MAP_MAX_ZOOM:
+        raise InvalidInputException(f"Zoom must be between 0 and {constants.MAP_MAX_ZOOM}")
+
+    if not -90 <= viewport.south <= viewport.north <= 90:
+        raise InvalidInputException("Invalid viewport latitudes")
+
+    if not (-180 <= viewport.west <= 180 and -180 <= viewport.east <= 180):
+        raise InvalidInputException("Invalid viewport longitudes")
+
+
+def get_viewport_tiles(viewport: schemas.MapViewport) -> List[Tuple[int, int]]:
+    tile_size = get_tile_size(viewport.zoom)
+    num_x_tiles = 2 ** viewport.zoom
+    num_y_tiles = math.ceil(180 / tile_size)
+
+    west = get_tile_index(viewport.west, 180, tile_size, num_x_tiles)
+    east = get_tile_index(viewport.east, 180, tile_size, num_x_tiles)
+    south = get_tile_index(viewport.south, 90, tile_size, num_y_tiles)
+    north = get_tile_index(viewport.north, 90, tile_size, num_y_tiles)
+
+    # A viewport crossing the antimeridian wraps back around to the first column
+    if viewport.west <= viewport.east:
+        x_tiles = list(range(west, east + 1))
+    else:
+        x_tiles = list(range(west, num_x_tiles)) + list(range(0, east + 1))
+
+    tiles = [(x, y) for x in x_tiles for y in range(south, north + 1)]
+    if len(tiles) > constants.MAP_MAX_TILES:
+        raise InvalidInputException("Viewport is too large for this zoom level")
+
+    return tiles
+
+
+def get_column_ranges(indexes: List[int]) -> List[Tuple[int, int]]:
+    # Merge consecutive tile indexes into (first, last) ranges
+    ranges = []
+    for index in sorted(set(indexes)):
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1] = (ranges[-1][0], index)
+        else:
+            ranges.append((index, index))
+    return ranges
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ------------------------------------------  Clustering  -------------------------------------------- #
+
+
+def get_event_locations(tiles: List[Tuple[int, int]], zoom: int):
+    tile_size = get_tile_size(zoom)
+    cell_size = tile_size / constants.MAP_CLUSTER_CELLS
+
+    south = min(y for _, y in tiles) * tile_size - 90
+    north = (max(y for _, y in tiles) + 1) * tile_size - 90
+    longitude_ranges = [
+        (first * tile_size - 180, (last + 1) * tile_size - 180) for first, last in get_column_ranges([x for x, _ in tiles])
+    ]
+
+    document = models.EventSearchDocument
+    return (
+        select(
+            document.event_id.label("eventId"),
+            document.likes.label("likes"),
+            document.start_time.label("startTime"),
+            document.latitude.label("latitude"),
+            document.longitude.label("longitude"),
+            func.floor((document.longitude + 180) / cell_size).label("cellX"),
+            func.floor((document.latitude + 90) / cell_size).label("cellY"),
+        )
+        .filter(
+            document.cancelled.is_(False),
+            document.end_time > datetime.now(),
+            between(document.latitude, south, north),
+            or_(*[between(document.longitude, west, east) for west, east in longitude_ranges]),
+        )
+        .subquery()
+    )
+
+
+def fetch_tile_clusters(tiles: List[Tuple[int, int]], zoom: int) -> Dict[Tuple[int, int], List[schemas.MapCluster]]:
+    locations = get_event_locations(tiles, zoom)
+
+    # The most liked events in each cluster are returned as its top events
+    top_event_ids = func.array_agg(
+        aggregate_order_by(locations.c.eventId, locations.c.likes.desc(), locations.c.startTime.asc()),
+        type_=ARRAY(Integer),
+    )[1 : constants.MAP_CLUSTER_TOP_EVENTS]
+
+    cell_clusters = db.get().execute(
+        select(
+            locations.c.cellX,
+            locations.c.cellY,
+            func.count().label("count"),
+            func.avg(locations.c.latitude).label("latitude"),
+            func.avg(locations.c.longitude).label("longitude"),
+            top_event_ids.label("eventListingIds"),
+        ).group_by(locations.c.cellX, locations.c.cellY)
+    ).fetchall()
+
+    tile_clusters = {tile: [] for tile in tiles}
+    for cell in cell_clusters:
+        tile = (int(cell.cellX) // constants.MAP_CLUSTER_CELLS, int(cell.cellY) // constants.MAP_CLUSTER_CELLS)
+        if tile not in tile_clusters:
+            continue
+
+        tile_clusters[tile].append(
+            schemas.MapCluster(
+                count=cell.count,
+                latitude=cell.latitude,
+                longitude=cell.longitude,
+                eventListingIds=cell.eventListingIds,
+            )
+        )
+
+    return tile_clusters
+
+
+def get_map_clusters(viewport: schemas.MapViewport) -> schemas.MapClusterList:
+    validate_viewport(viewport)
+
+    clusters = []
+    missing_tiles = []
+    for tile in get_viewport_tiles(viewport):
+        cached_clusters = tile_cache.get((viewport.zoom, *tile))
+        if cached_clusters is None:
+            missing_tiles.append(tile)
+        else:
+            clusters.extend(cached_clusters)
+
+    # Compute every uncached tile in one grouped query
+    if missing_tiles:
+        for tile, tile_clusters in fetch_tile_clusters(missing_tiles, viewport.zoom).items():
+            tile_cache.set((viewport.zoom, *tile), tile_clusters)
+            clusters.extend(tile_clusters)
+
+    return schemas.MapClusterList(clusters=clusters)
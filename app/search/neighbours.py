@@ -0,0 +1,181 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import func, insert, literal, select, union_all
+
+from .. import models, constants
+from ..database import db, get_db
+
+
+# Set in each worker by init_worker so the matrix is sent once per process rather than once per shard
+worker_interactions = None
+worker_candidates = None
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# -------------------------------------------  Matrix  ----------------------------------------------- #
+
+
+def get_interactions() -> List:
+    booked = select(
+        models.Booking.customer_id,
+        models.Booking.event_id,
+        literal(constants.CO_BOOKING_BOOKING_WEIGHT).label("weight"),
+    ).where(models.Booking.cancelled.isnot(True))
+    favourited = select(
+        models.FavouritedEvent.customer_id,
+        models.FavouritedEvent.event_id,
+        literal(constants.CO_BOOKING_FAVOURITE_WEIGHT).label("weight"),
+    )
+    liked = select(
+        models.Like.customer_id,
+        models.Like.event_id,
+        literal(constants.CO_BOOKING_LIKE_WEIGHT).label("weight"),
+    )
+    interactions = union_all(booked, favourited, liked).subquery()
+
+    return db.get().execute(
+        select(interactions.c.customer_id, interactions.c.event_id, func.sum(interactions.c.weight))
+        .where(interactions.c.customer_id.isnot(None), interactions.c.event_id.isnot(None))
+        .group_by(interactions.c.customer_id, interactions.c.event_id)
+    ).all()
+
+
+def get_interaction_matrix(interactions: List, event_ids: List[int]) -> sparse.csc_matrix:
+    """
+    Customer by event matrix of interaction weights, each event column is l2 normalised
+    so the dot product of two columns is the cosine similarity of who interacted with them
+    """
+    customer_rows = {}
+    event_columns = {event_id: column for column, event_id in enumerate(event_ids)}
+    rows, columns, weights = [], [], []
+    for customer_id, event_id, weight in interactions:
+        rows.append(customer_rows.setdefault(customer_id, len(customer_rows)))
+        columns.append(event_columns[event_id])
+        weights.append(float(weight))
+
+    matrix = sparse.csc_matrix((weights, (rows, columns)), shape=(len(customer_rows), len(event_ids)))
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1
+    return matrix.dot(sparse.diags(1 / norms)).tocsc()
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# -------------------------------------------  Workers  ---------------------------------------------- #
+
+
+def init_worker(interactions: sparse.csc_matrix, candidates: np.ndarray):
+    global worker_interactions, worker_candidates
+    worker_interactions = interactions
+    worker_candidates = candidates
+
+
+def get_shard_neighbours(columns: List[int]) -> List[Tuple[int, int, int, float]]:
+    """
+    The top neighbours of each event column in the shard as (column, neighbour column, rank, score)
+    """
+    shard = worker_interactions[:, columns]
+    scores = shard.T.dot(worker_interactions[:, worker_candidates]).tocsr()
+
+    neighbours = []
+    for row, column in enumerate(columns):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        candidates = worker_candidates[scores.indices[start:end]]
+        values = scores.data[start:end]
+
+        # An event is not its own neighbour
+        keep = candidates != column
+        candidates, values = candidates[keep], values[keep]
+        if len(values) > constants.EVENT_NEIGHBOURS:
+            top = np.argpartition(-values, constants.EVENT_NEIGHBOURS)[: constants.EVENT_NEIGHBOURS]
+            candidates, values = candidates[top], values[top]
+
+        # Highest score first, ties by event
+        order = np.lexsort((candidates, -values))
+        for rank, index in enumerate(order):
+            neighbours.append((column, int(candidates[index]), rank, float(values[index])))
+
+    return neighbours
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ---------------------------------------------  Job  ------------------------------------------------ #
+
+
+def get_upcoming_event_ids() -> set:
+    event_ids = (
+        db.get()
+        .query(models.Event.event_id)
+        .filter(models.Event.cancelled.is_(False))
+        .filter(models.Event.end_time > datetime.now())
+        .all()
+    )
+    return {item[0] for item in event_ids}
+
+
+def save_event_neighbours(rows: List[dict]):
+    # Replaced in one transaction so readers never see a partial table
+    db.get().query(models.EventNeighbour).delete()
+    for start in range(0, len(rows), constants.CO_BOOKING_BATCH_SIZE):
+        db.get().execute(insert(models.EventNeighbour), rows[start : start + constants.CO_BOOKING_BATCH_SIZE])
+
+
+def build_event_neighbours(workers: int, shard_size: int = constants.CO_BOOKING_SHARD_SIZE) -> int:
+    interactions = get_interactions()
+    event_ids = sorted({event_id for _, event_id, _ in interactions})
+    matrix = get_interaction_matrix(interactions, event_ids)
+
+    # Every event gets neighbours but only upcoming events can be recommended
+    upcoming = get_upcoming_event_ids()
+    candidates = np.array([column for column, event_id in enumerate(event_ids) if event_id in upcoming], dtype=int)
+
+    columns = list(range(len(event_ids)))
+    shards = [columns[start : start + shard_size] for start in range(0, len(columns), shard_size)]
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(matrix, candidates)) as executor:
+        for neighbours in executor.map(get_shard_neighbours, shards):
+            rows.extend(
+                {"event_id": event_ids[column], "neighbour_id": event_ids[neighbour], "rank": rank, "score": score}
+                for column, neighbour, rank, score in neighbours
+            )
+
+    save_event_neighbours(rows)
+    return len(rows)
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# --------------------------------------------  Reads  ----------------------------------------------- #
+
+
+def get_event_neighbour_ids(event_id: int, amount: int = constants.ALSO_BOOKED_RESULTS) -> List[int]:
+    neighbour_ids = (
+        db.get()
+        .query(models.Event.event_id)
+        .join(models.EventNeighbour, models.EventNeighbour.neighbour_id == models.Event.event_id)
+        .filter(models.EventNeighbour.event_id == event_id)
+        .filter(models.Event.cancelled.is_(False))
+        .filter(models.Event.end_time > datetime.now())
+        .order_by(models.EventNeighbour.rank)
+        .limit(amount)
+        .all()
+    )
+    return [item[0] for item in neighbour_ids]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the events customers booked, liked or favourited together.")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--shard-size", type=int, default=constants.CO_BOOKING_SHARD_SIZE, help="Events per shard")
+    args = parser.parse_args()
+
+    with get_db() as session:
+        db.set(session)
+        num_neighbours = build_event_neighbours(args.workers, args.shard_size)
+        session.commit()
+
+    print(f"Saved {num_neighbours} event neighbours")
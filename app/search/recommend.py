@@ -1,64 +1,71 @@
-from sqlalchemy import desc
+import asyncio
+import heapq
+import logging
+import threading
+import time
+from typing import Iterable, List, Optional, Set, Tuple
+from fastapi.responses import StreamingResponse
+from sqlalchemy import desc, event, func, case, exists, select, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
 from .. import models, schemas, constants
-from ..events import event_preview
-from ..database import db
+from ..events import event_preview, event_stream
+from ..database import db, get_db
 from .sort_filter import get_subset_results
 from datetime import datetime
-from difflib import SequenceMatcher
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+from . import features, neighbours, trending
 
 
-def get_generic_results(start: int, amount: int = constants.SEARCH_RESULTS) -> schemas.EventListingPreviewList:
-
-    # Get all events ordered descending by liked omitting cancelled and past
-    results = (
-        db.get()
-        .query(models.Event)
-        .filter(models.Event.cancelled.is_(False))
-        .filter(models.Event.end_time > datetime.now())
-        .order_by(desc(models.Event.likes))
-        .all()
-    )
+logger = logging.getLogger(__name__)
 
-    # Get the required subset
-    boundary_end = len(results)
-    results = get_subset_results(results, start, boundary_end, amount)
-    return schemas.EventListingPreviewList(eventListings=[event_preview.get_event_preview(event) for event in results])
+# Customers whose list is missing or changed by their own likes, follows or bookings, refreshed by the job
+pending_users: Set[int] = set()
+pending_users_lock = threading.Lock()
 
+# Commits can happen on worker threads so queued customers wake the job through the loop it runs on
+job_loop: Optional[asyncio.AbstractEventLoop] = None
+users_queued: Optional[asyncio.Event] = None
 
-def get_all_generic_events() -> schemas.EventListingPreviewList:
-    results = (
-        db.get()
-        .query(models.Event.event_id.label("event_id"))
-        .filter(models.Event.cancelled.is_(False))
-        .filter(models.Event.end_time > datetime.now())
-        .order_by(desc(models.Event.likes))
-        .all()
-    )
 
-    return schemas.EventListingPreviewList(eventListings=[event_preview.get_event_preview(event) for event in results])
+def get_generic_results(start: int, amount: int = constants.SEARCH_RESULTS) -> schemas.EventListingPreviewList:
+    # Get the required subset of the trending leaderboard
+    event_ids = trending.get_trending_event_ids(start, amount)
+    previews = event_preview.get_event_previews(event_ids, *trending.get_upcoming_filters())
+    return schemas.EventListingPreviewList(eventListings=previews)
 
 
-def get_all_tags() -> schemas.Tags:
-    results = db.get().query(models.Tag.tag_name).order_by(models.Tag.tag_name).all()
+def get_all_generic_events() -> schemas.EventListingPreviewList:
+    event_ids = trending.get_trending_event_ids(constants.START)
+    previews = event_preview.get_event_previews(event_ids, *trending.get_upcoming_filters())
+    return schemas.EventListingPreviewList(eventListings=previews)
 
-    # Create a list to hold tag names
-    tags_list = []
 
-    for tag in results:
-        tags_list.append(tag.tag_name)
+def get_all_generic_stream() -> StreamingResponse:
+    event_ids = trending.get_trending_event_ids(constants.START)
+    return event_stream.get_preview_stream(event_ids, *trending.get_upcoming_filters())
 
-    # Create a Tags object and set the tags field
-    tags = schemas.Tags(tags=tags_list)
 
-    return tags
+def get_all_tags(order: constants.TagOrder = constants.TagOrder.NAME) -> schemas.Tags:
+    tag_index = trending.get_tag_index()
+    return schemas.Tags(tags=tag_index.get_tags(order), eventCounts=tag_index.event_counts)
 
 
 def get_trending_generic_events():
     return get_generic_results(constants.START, constants.TRENDING)
 
 
-def calculate_similarity_ratio(text1, text2):
-    return SequenceMatcher(None, text1, text2).ratio()
+def get_trending_generic_versions() -> List:
+    event_ids = trending.get_trending_event_ids(constants.START, constants.TRENDING)
+    versions = event_preview.get_event_preview_versions(event_ids, *trending.get_upcoming_filters())
+    return [(event_id, versions[event_id]) for event_id in event_ids if event_id in versions]
+
+
+def get_trending_tag_events(tag_name: str) -> schemas.EventListingPreviewList:
+    event_ids = trending.get_trending_tag_event_ids(tag_name)
+    previews = event_preview.get_event_previews(event_ids, *trending.get_upcoming_filters())
+    return schemas.EventListingPreviewList(eventListings=previews)
 
 
 def calculate_base_event_score(event, liked_events, followed_hosts):
@@ -72,90 +79,326 @@ def calculate_base_event_score(event, liked_events, followed_hosts):
     return score
 
 
-def calculate_event_score(event, past_events, liked_events, followed_hosts):
-    # Calculate similarity ratio between event title and description with past
-    similarity_scores = []
-    for past_event in past_events:
-        title_similarity = calculate_similarity_ratio(event.title, past_event.title)
-        description_similarity = calculate_similarity_ratio(event.description, past_event.description)
-        similarity_score = max(title_similarity, description_similarity)
-        similarity_scores.append(similarity_score)
+def calculate_event_scores(events, past_event_ids, liked_events, followed_hosts, neighbour_scores) -> np.ndarray:
+    scores = np.array(
+        [calculate_base_event_score(event, liked_events, followed_hosts) for event in events], dtype=np.float64
+    )
 
-    # Include highest of past booking similarities if they exist
-    if len(similarity_scores) > 0:
-        max_similarity = max(similarity_scores)
-    else:
-        max_similarity = 0
+    # Events booked, liked or favourited by the same customers as the user's events
+    scores += constants.NEIGHBOUR_WEIGHT * np.array(
+        [neighbour_scores.get(event.event_id, 0) for event in events], dtype=np.float64
+    )
 
-    score = calculate_base_event_score(event, liked_events, followed_hosts)
+    # Score every candidate against every past booking in one batched similarity calculation
+    similarity = features.get_event_features().get_max_similarity(
+        [event.event_id for event in events], past_event_ids
+    )
 
-    # Check if the similarity ratio is above the threshold
-    if max_similarity > constants.SIMILARITY_THRESHOLD:
-        # If there is a similarity, give the event a higher score
-        score += constants.HIGH_SCORE
+    # If there is a similarity, give the event a higher score
+    scores[similarity > constants.CONTENT_SIMILARITY_THRESHOLD] += constants.HIGH_SCORE
+    return scores
 
-    return score
 
+def get_also_booked_events(event_id: int) -> schemas.EventListingPreviewList:
+    event_ids = neighbours.get_event_neighbour_ids(event_id)
+    return schemas.EventListingPreviewList(eventListings=event_preview.get_event_previews(event_ids))
+
+
+def get_relevance_score(event_id, host_id, likes, user_id: int):
+    # The recommendation score as a SQL expression so searches can order and page on it
+    liked = exists().where(models.Like.customer_id == user_id, models.Like.event_id == event_id)
+    followed = exists().where(models.Follower.customer_id == user_id, models.Follower.host_id == host_id)
+    booked = exists().where(models.Booking.customer_id == user_id, models.Booking.event_id == event_id)
+
+    # Events in the user's stored list use the score the home page ranked them by, content similarity included
+    stored_score = (
+        select(models.UserRecommendation.score)
+        .where(models.UserRecommendation.customer_id == user_id, models.UserRecommendation.event_id == event_id)
+        .scalar_subquery()
+    )
+
+    # Anything else scored below the whole list so only its base score is left to order by
+    base_score = (
+        case((liked, constants.LIKE_WEIGHT), else_=0)
+        + case((followed, constants.FOLLOW_WEIGHT), else_=0)
+        + func.coalesce(likes, 0) * constants.POPULARITY_WEIGHT
+    )
+
+    # Events the user has already booked are not recommended so go last
+    return case((booked, -1), else_=func.coalesce(stored_score, base_score))
+
+
+def get_candidate_events(user_id: int, after_event_id: int = 0) -> List[models.Event]:
+    liked = select(models.Like.event_id).where(models.Like.customer_id == user_id)
+    booked = select(models.Booking.event_id).where(models.Booking.customer_id == user_id)
+    followed_hosts = select(models.Follower.host_id).where(models.Follower.customer_id == user_id)
+    liked_hosts = select(models.Event.host_id).where(models.Event.event_id.in_(liked))
+    interest_tags = select(models.EventTag.tag_id).where(models.EventTag.event_id.in_(liked.union(booked)))
+    neighbour_events = select(models.EventNeighbour.neighbour_id).where(
+        models.EventNeighbour.event_id.in_(liked.union(booked))
+    )
+    popular = (
+        select(models.Event.event_id)
+        .where(models.Event.cancelled.is_(False))
+        .where(models.Event.end_time > datetime.now())
+        .order_by(desc(models.Event.likes))
+        .limit(constants.RECOMMENDATION_POPULAR_CANDIDATES)
+    )
+
+    # Only upcoming events related to what the user likes, follows or booked, or that are popular, can score well
+    return (
+        db.get()
+        .query(models.Event)
+        .filter(models.Event.cancelled.is_(False))
+        .filter(models.Event.end_time > datetime.now())
+        .filter(models.Event.event_id > after_event_id)
+        .filter(~exists().where(models.Booking.customer_id == user_id, models.Booking.event_id == models.Event.event_id))
+        .filter(
+            or_(
+                models.Event.event_id.in_(liked),
+                models.Event.host_id.in_(followed_hosts),
+                models.Event.host_id.in_(liked_hosts),
+                models.Event.event_id.in_(popular),
+                models.Event.event_id.in_(neighbour_events),
+                exists().where(
+                    models.EventTag.event_id == models.Event.event_id, models.EventTag.tag_id.in_(interest_tags)
+                ),
+            )
+        )
+        .order_by(desc(models.Event.likes), models.Event.event_id)
+        .limit(constants.RECOMMENDATION_MAX_CANDIDATES)
+        .all()
+    )
 
-def get_ordered_recommendations(user_id: int):
+
+def score_events(user_id: int, events: List[models.Event]) -> np.ndarray:
     # Get all the events a user has liked
     liked_events = db.get().query(models.Like.event_id).filter(models.Like.customer_id == user_id).all()
-    liked_events = [item[0] for item in liked_events]
+    liked_events = {item[0] for item in liked_events}
 
     # Get all the hosts a user is following
     followed_hosts = db.get().query(models.Follower.host_id).filter(models.Follower.customer_id == user_id).all()
-    followed_hosts = [item[0] for item in followed_hosts]
+    followed_hosts = {item[0] for item in followed_hosts}
 
     # Get all of a users past bookings
-    past_events = (
+    past_event_ids = db.get().query(models.Booking.event_id).filter(models.Booking.customer_id == user_id).all()
+    past_event_ids = [item[0] for item in past_event_ids]
+
+    # Get the closest neighbour score of every event near the ones a user liked or booked
+    neighbour_scores = (
         db.get()
-        .query(models.Event)
-        .join(models.Booking, models.Booking.event_id == models.Event.event_id)
-        .filter(models.Booking.customer_id == user_id)
+        .query(models.EventNeighbour.neighbour_id, func.max(models.EventNeighbour.score))
+        .filter(models.EventNeighbour.event_id.in_(liked_events | set(past_event_ids)))
+        .group_by(models.EventNeighbour.neighbour_id)
+        .all()
+    )
+    neighbour_scores = dict(neighbour_scores)
+
+    # Calculate the recommendation score for each event
+    return calculate_event_scores(events, past_event_ids, liked_events, followed_hosts, neighbour_scores)
+
+
+def get_scored_recommendations(user_id: int, amount: int) -> Tuple[List[models.Event], List[float]]:
+    candidates = get_candidate_events(user_id)
+    scores = score_events(user_id, candidates)
+
+    # Keep the highest scoring events, ties keep the candidate order
+    top = heapq.nlargest(amount, range(len(candidates)), key=scores.__getitem__)
+    return [candidates[index] for index in top], [float(scores[index]) for index in top]
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# -----------------------------------  Stored Recommendations  --------------------------------------- #
+
+
+def store_user_recommendations(user_id: int, scored_event_ids: List[Tuple[int, float]], latest_event_id: int):
+    rows = [
+        {
+            "customer_id": user_id,
+            "event_id": event_id,
+            "rank": rank,
+            "score": score,
+            "latest_event_id": latest_event_id,
+        }
+        for rank, (event_id, score) in enumerate(scored_event_ids)
+    ]
+
+    db.get().query(models.UserRecommendation).filter(models.UserRecommendation.customer_id == user_id).delete()
+    if rows:
+        db.get().execute(insert(models.UserRecommendation).values(rows).on_conflict_do_nothing())
+
+
+def refresh_user_recommendations(user_id: int) -> List[models.Event]:
+    # Events created after this point are merged in by the next periodic job
+    latest_event_id = db.get().query(func.max(models.Event.event_id)).scalar() or 0
+    recommended_events, scores = get_scored_recommendations(user_id, constants.RECOMMENDATIONS_PER_USER)
+    store_user_recommendations(
+        user_id, [(event.event_id, score) for event, score in zip(recommended_events, scores)], latest_event_id
+    )
+    return recommended_events
+
+
+def merge_new_recommendations(user_id: int, after_event_id: int, latest_event_id: int):
+    """
+    Score only the events created since the list was stored and merge them into its top events, every
+    event left out of the list before still scores below all of it
+    """
+    stored = (
+        db.get()
+        .query(models.UserRecommendation.event_id, models.UserRecommendation.score)
+        .filter(models.UserRecommendation.customer_id == user_id)
+        .order_by(models.UserRecommendation.rank)
         .all()
     )
+    new_events = get_candidate_events(user_id, after_event_id)
+    new_scores = score_events(user_id, new_events)
+
+    # Ties keep the stored order ahead of the new events
+    scored_event_ids = [(row.event_id, row.score) for row in stored]
+    scored_event_ids += [(event.event_id, float(score)) for event, score in zip(new_events, new_scores)]
+    top = heapq.nlargest(constants.RECOMMENDATIONS_PER_USER, scored_event_ids, key=lambda item: item[1])
+    store_user_recommendations(user_id, top, latest_event_id)
+
 
-    # Get all of not past events
-    all_events = (
+def get_stored_recommendations(user_id: int) -> List[models.Event]:
+    # Events booked since the list was stored are no longer recommended
+    booked = exists().where(models.Booking.customer_id == user_id, models.Booking.event_id == models.Event.event_id)
+    return (
         db.get()
         .query(models.Event)
-        .filter(models.Event.event_id.notin_([event.event_id for event in past_events]))
+        .join(models.UserRecommendation, models.UserRecommendation.event_id == models.Event.event_id)
+        .filter(models.UserRecommendation.customer_id == user_id)
+        .filter(models.Event.cancelled.is_(False))
+        .filter(models.Event.end_time > datetime.now())
+        .filter(~booked)
+        .order_by(models.UserRecommendation.rank)
         .all()
     )
 
-    # Calculate the recommendation score for each event
-    recommendation_scores = []
-
-    for event in all_events:
-        score = calculate_event_score(event, past_events, liked_events, followed_hosts)
-        recommendation_scores.append({"event": event, "score": score})
 
-    # Sort the events based on their scores
-    recommended_events = sorted(recommendation_scores, key=lambda x: x["score"], reverse=True)
-    # Get the recommended events
-    return [item["event"] for item in recommended_events]
+def get_recommendations(user_id: int) -> List[models.Event]:
+    # Read only, a list that was never stored or whose events have all finished is scored for this request
+    recommended_events = get_stored_recommendations(user_id)
+    if not recommended_events:
+        queue_user_recommendations([user_id])
+        recommended_events, _ = get_scored_recommendations(user_id, constants.RECOMMENDATIONS_PER_USER)
+    return recommended_events
 
 
 def get_recommended_events(user_id: int, start: int) -> schemas.EventListingPreviewList:
     # Get the required subset of recommended events
-    recommended_events = get_ordered_recommendations(user_id=user_id)
+    recommended_events = get_recommendations(user_id=user_id)
     boundary_end = len(recommended_events)
     recommended_events = get_subset_results(recommended_events, start, boundary_end)
 
     return schemas.EventListingPreviewList(
-        eventListings=[
-            event_preview.get_event_preview(event)
-            for event in recommended_events
-        ]
+        eventListings=event_preview.get_event_previews([event.event_id for event in recommended_events])
     )
 
 
 def get_all_recommended_events(user_id: int) -> schemas.EventListingPreviewList:
-    recommended_events = get_ordered_recommendations(user_id=user_id)
+    recommended_events = get_recommendations(user_id=user_id)
 
     return schemas.EventListingPreviewList(
-        eventListings=[
-            event_preview.get_event_preview(event)
-            for event in recommended_events
-        ]
+        eventListings=event_preview.get_event_previews([event.event_id for event in recommended_events])
     )
+
+
+def get_all_recommended_stream(user_id: int) -> StreamingResponse:
+    # The stored list is capped so only the previews need streaming
+    event_ids = [event.event_id for event in get_recommendations(user_id=user_id)]
+    return event_stream.get_preview_stream(event_ids)
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ------------------------------------------  Periodic Job  ------------------------------------------ #
+
+
+def queue_user_recommendations(user_ids: Iterable[int]):
+    with pending_users_lock:
+        pending_users.update(user_ids)
+    if job_loop is not None:
+        job_loop.call_soon_threadsafe(users_queued.set)
+
+
+def run_recommendations_job(merge_new_events: bool):
+    global pending_users
+    with pending_users_lock:
+        users, pending_users = pending_users, set()
+
+    with get_db() as session:
+        db.set(session)
+        try:
+            for user_id in users:
+                refresh_user_recommendations(user_id)
+            session.commit()
+        except Exception:
+            # The stored lists are kept until a later run refreshes them
+            with pending_users_lock:
+                pending_users.update(users)
+            raise
+
+        if not merge_new_events:
+            return
+
+        # Lists stored before the newest event only need the events created since merged in
+        latest_event_id = db.get().query(func.max(models.Event.event_id)).scalar() or 0
+        stale = (
+            db.get()
+            .query(models.UserRecommendation.customer_id, func.min(models.UserRecommendation.latest_event_id))
+            .group_by(models.UserRecommendation.customer_id)
+            .having(func.min(models.UserRecommendation.latest_event_id) < latest_event_id)
+            .all()
+        )
+        for user_id, after_event_id in stale:
+            merge_new_recommendations(user_id, after_event_id, latest_event_id)
+            session.commit()
+
+
+async def refresh_recommendations_periodically():
+    global job_loop, users_queued
+    job_loop, users_queued = asyncio.get_running_loop(), asyncio.Event()
+
+    merged_at = None
+    while True:
+        users_queued.clear()
+        merge_new_events = merged_at is None or time.monotonic() - merged_at >= constants.RECOMMENDATION_REFRESH_SECONDS
+        try:
+            await run_in_threadpool(run_recommendations_job, merge_new_events)
+            if merge_new_events:
+                merged_at = time.monotonic()
+        except Exception:
+            logger.exception("Failed to refresh the stored recommendations")
+
+        # Queued customers wake the job early, the writes of a short window are refreshed together
+        next_merge = constants.RECOMMENDATION_REFRESH_SECONDS - (time.monotonic() - (merged_at or time.monotonic()))
+        try:
+            await asyncio.wait_for(users_queued.wait(), timeout=max(next_merge, 0))
+            await asyncio.sleep(constants.RECOMMENDATION_QUEUE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ------------------------------------  Write Notification  ------------------------------------------ #
+
+
+@event.listens_for(Session, "after_flush")
+def _track_recommendation_writes(session: Session, flush_context):
+    # Likes, follows, bookings and booking cancellations all change what a customer is recommended
+    customer_ids = session.info.setdefault("recommendation_customer_ids", set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (models.Like, models.Follower, models.Booking)) and instance.customer_id is not None:
+            customer_ids.add(instance.customer_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _queue_recommendation_writes(session: Session):
+    customer_ids = session.info.pop("recommendation_customer_ids", set())
+    if customer_ids:
+        queue_user_recommendations(customer_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_recommendation_writes(session: Session):
+    session.info.pop("recommendation_customer_ids", None)
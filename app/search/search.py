@@ -1,58 +1,186 @@
-from typing import Dict, List, Union
-from .. import models, schemas
+from typing import Dict, List, Tuple, Union
+from .. import models, schemas, constants, helpers
+from ..cache import TTLCache, clear_on_write
 from ..database import db
+from ..exceptions import InvalidInputException
 from datetime import datetime
-from sqlalchemy import union_all, or_
+from sqlalchemy import func, cast, literal, select, null, Float
+from sqlalchemy.dialects.postgresql import REGCONFIG
 from ..constants import SortOption
-from .recommend import get_ordered_recommendations
+from .recommend import get_relevance_score
+from .facets import get_search_facets
 
-from .sort_filter import get_event_filters, get_event_sort, filter_distance, get_subset_results
+from .sort_filter import (
+    get_event_filters,
+    get_distance_filters,
+    get_distance_km,
+    get_sort_key,
+    get_keyset_order,
+    get_keyset_filter,
+    encode_cursor,
+    decode_cursor,
+)
 from ..events import event_preview
 
 
-def run_search_query(criteria: schemas.sortFilterEventListings, user_id: Union[int, None] = None):
+# Pages of search results keyed by the normalized search criteria
+search_cache = TTLCache(max_size=constants.SEARCH_CACHE_SIZE, ttl=constants.SEARCH_CACHE_SECONDS)
+clear_on_write(
+    search_cache,
+    models.Event,
+    models.OnlineEvent,
+    models.SeatedEvent,
+    models.NotSeatedEvent,
+    models.Venue,
+    models.Tag,
+    models.EventTag,
+    models.Like,
+    models.Dislike,
+    models.Follower,
+    models.Host,
+    models.Booking,
+    models.EventReview,
+    models.UserRecommendation,
+)
+
+
+def get_search_tsquery(search_str: str):
+    return func.websearch_to_tsquery(cast(constants.SEARCH_LANGUAGE, REGCONFIG), search_str)
+
+
+def get_search_filters(criteria: schemas.sortFilterEventListings, user_id: Union[int, None] = None) -> dict:
 
     # Get the filter criteria for the search
-    search_str = criteria.searchQuery
+    search_str = (criteria.searchQuery or "").strip()
     filter_info = get_event_filters(criteria=criteria)
-    filter_info["filters"].append(
-        or_(
-            models.Event.title.ilike(f"%{search_str}%"),
-            models.Event.description.ilike(f"%{search_str}%")
+
+    # Match against the indexed full text search document and rank the matches
+    document = models.EventSearchDocument
+    if search_str:
+        ts_query = get_search_tsquery(search_str)
+        filter_info["filters"].append(document.search_vector.op("@@")(ts_query))
+        search_rank = func.ts_rank(document.search_vector, ts_query)
+    else:
+        search_rank = literal(0)
+
+    # Exclude cancelled and past events from the search
+    filter_info["filters"].append(document.cancelled.is_(False))
+    filter_info["filters"].append(document.end_time > datetime.now())
+
+    if criteria.sort == SortOption.NEAREST.value and not criteria.locationCoord:
+        raise InvalidInputException("Cannot retrieve your location to sort by distance")
+    user_location = helpers.parse_coordinates(criteria.locationCoord) if criteria.locationCoord else None
+
+    # Add the bounding box and radius filter if specified for the search, online events have no coordinates
+    if "location_info" in filter_info.keys():
+        filter_info["filters"].extend(
+            get_distance_filters(document.latitude, document.longitude, filter_info["location_info"])
         )
+
+    distance = null()
+    if user_location:
+        distance = get_distance_km(document.latitude, document.longitude, *user_location)
+
+    # Relevance is the text rank, plus the recommendation score when the user is known
+    relevance = search_rank
+    if user_id:
+        relevance = search_rank + get_relevance_score(document.event_id, document.host_id, document.likes, user_id)
+
+    filter_info["relevance"] = cast(relevance, Float)
+    filter_info["distance"] = distance
+    return filter_info
+
+
+def get_search_page(
+    criteria: schemas.sortFilterEventListings, user_id: Union[int, None] = None
+) -> schemas.EventListingPreviewList:
+    filter_info = get_search_filters(criteria, user_id)
+    results = (
+        event_preview.get_search_documents_preview()
+        .add_columns(filter_info["relevance"].label("relevanceScore"), filter_info["distance"].label("distanceKm"))
+        .filter(*filter_info["filters"])
+        .subquery()
     )
 
-    # Exclude cancelled and past events from the searc
-    filter_info["filters"].append((models.Event.cancelled.is_(False)))
-    filter_info["filters"].append((models.Event.end_time > datetime.now()))
+    # Order by the sort key with the event id as a tie breaker
+    sort_key, direction = get_sort_key(results, criteria.sort)
+    query = select(results) if sort_key is None else select(results, sort_key.label("sortKey"))
+    query = query.order_by(*get_keyset_order(sort_key, results.c.eventListingId, direction))
 
-    # Get all the types of events in the search
-    online_events = event_preview.get_online_events_preview().filter(*filter_info["filters"])
-    non_seated_events = event_preview.get_non_seated_events_preview().filter(*filter_info["filters"])
-    seated_events = event_preview.get_seated_events_preview().filter(*filter_info["filters"])
+    # Continue after the last result of the previous page
+    if criteria.cursor:
+        cursor_values = decode_cursor(criteria.cursor, criteria.sort)
+        query = query.filter(get_keyset_filter(sort_key, results.c.eventListingId, direction, cursor_values))
 
-    # Combine all types of events
-    query = union_all(online_events, non_seated_events, seated_events)
+    # Fetch one extra row to know whether another page exists
+    page_results = db.get().execute(query.limit(constants.SEARCH_RESULTS + 1)).fetchall()
+    has_more = len(page_results) > constants.SEARCH_RESULTS
+    page_results = page_results[: constants.SEARCH_RESULTS]
 
-    # Apply sorting based on criteria
-    if criteria.sort:
-        sort = get_event_sort(criteria.sort)
-        if sort is not None:
-            query = query.order_by(sort)
+    next_cursor = None
+    if has_more:
+        last_result = page_results[-1]
+        sort_value = None if sort_key is None else last_result.sortKey
+        next_cursor = encode_cursor(criteria.sort, sort_value, last_result.eventListingId)
 
-    results = db.get().execute(query).fetchall()
+    preview_list = event_preview.parse_preview_output(custom_results=page_results)
+    preview_list.hasMore = has_more
+    preview_list.nextCursor = next_cursor
+    return preview_list
 
-    # Add a location filter if specified for the search
-    if "location_info" in filter_info.keys():
-        results = filter_distance(results, location_info=filter_info["location_info"])
-
-    boundary_end = len(results)
-    subset_results = get_subset_results(results, criteria.start, boundary_end)
-    # Sort by relevance if specified in the search
-    if criteria.sort == SortOption.RELEVANCE.value and user_id:
-        recommended_order = get_ordered_recommendations(user_id=user_id)
-        new_order = [item.event_id for item in recommended_order]
-        index_map = {value: index for index, value in enumerate(new_order)}
-        subset_results = sorted(subset_results, key=lambda item: index_map.get(item.eventListingId, len(new_order)))
-
-    return event_preview.parse_preview_output(custom_results=subset_results)
+
+# ---------------------------------------------------------------------------------------------------- #
+# -----------------------------------------  Result Cache  ------------------------------------------- #
+
+
+def normalize_search_criteria(criteria: schemas.sortFilterEventListings) -> Tuple[schemas.sortFilterEventListings, Tuple]:
+    # Equivalent queries share a cache entry, the location is snapped to a grid so nearby users do too
+    search_str = " ".join((criteria.searchQuery or "").lower().split())
+    location_coord = None
+    if criteria.locationCoord:
+        latitude, longitude = helpers.parse_coordinates(criteria.locationCoord)
+        location_coord = (
+            f"({round(latitude, constants.SEARCH_CACHE_COORD_DECIMALS)}, "
+            f"{round(longitude, constants.SEARCH_CACHE_COORD_DECIMALS)})"
+        )
+
+    filter_key = None
+    if criteria.filter:
+        filter_key = tuple(
+            (name, tuple(sorted(value)) if isinstance(value, list) else value)
+            for name, value in sorted(criteria.filter.dict(exclude_none=True).items())
+        )
+
+    criteria = criteria.copy(update={"searchQuery": search_str, "locationCoord": location_coord})
+    return criteria, (search_str, location_coord, filter_key)
+
+
+def run_search_query(criteria: schemas.sortFilterEventListings, user_id: Union[int, None] = None):
+    # Pages are only reached through the cursor, an offset would silently return the first page again
+    if criteria.start:
+        raise InvalidInputException("Search results are paged with the cursor, start must be 0.")
+
+    criteria, filter_key = normalize_search_criteria(criteria)
+
+    # Only the relevance order depends on who is searching
+    if criteria.sort != SortOption.RELEVANCE.value:
+        user_id = None
+
+    page_key = ("page", *filter_key, criteria.sort or "", criteria.cursor, user_id)
+    preview_list = search_cache.get(page_key)
+    if preview_list is None:
+        preview_list = get_search_page(criteria, user_id)
+        search_cache.set(page_key, preview_list)
+
+    # Facets only depend on the filtered set so are shared by every sort and page
+    facets = None
+    if criteria.facets:
+        facets_key = ("facets", *filter_key)
+        facets = search_cache.get(facets_key)
+        if facets is None:
+            facets = get_search_facets(get_search_filters(criteria)["filters"])
+            search_cache.set(facets_key, facets)
+
+    return schemas.EventListingPreviewList(
+        eventListings=preview_list.eventListings, hasMore=preview_list.hasMore, nextCursor=preview_list.nextCursor, facets=facets
+    )
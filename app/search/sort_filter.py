@@ -1,12 +1,15 @@
-from .. import models, schemas, constants
+from .. import models, schemas, constants, helpers
 from datetime import datetime as datetimemod
+from decimal import Decimal
+import base64
 import datetime
+import json
+import math
 from typing import List
-from sqlalchemy import or_, func, desc, asc
+from sqlalchemy import func, desc, asc, tuple_
 from sqlalchemy.sql import between
 from ..exceptions import InvalidInputException
 from ..constants import SortOption
-import math
 
 
 def convert_sort_criteria(sort_column):
@@ -25,38 +28,31 @@ def get_subset_results(results: List, start: int, boundary_end: int, num: int =
     return subset_results
 
 
-def filter_distance(results, location_info):
-    # Conver the coordinate format
-    filter_distance = location_info["kmNearMe"]
-    location = location_info["location"].strip("()")
-    new_results = []
-    latitude, longitude = location.split(",")
+def get_distance_km(latitude, longitude, user_latitude: float, user_longitude: float):
+    # Use the haversine formula to calculate the great circle distance
+    latitude_term = func.pow(func.sin(func.radians(latitude - user_latitude) * 0.5), 2)
+    longitude_term = func.pow(func.sin(func.radians(longitude - user_longitude) * 0.5), 2)
+    half_chord = latitude_term + math.cos(math.radians(user_latitude)) * func.cos(func.radians(latitude)) * longitude_term
+
+    return 2 * constants.EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(half_chord, 1)))
 
-    # Convert the latitude and longitude to floats
-    user_latitude = float(latitude.strip())
-    user_longitude = float(longitude.strip())
 
-    for result in results:
-        coordinates = result.location_coords
-        if coordinates:
-            latitude, longitude = coordinates.strip("()").split(",")
+def get_distance_filters(latitude, longitude, location_info) -> List:
+    user_latitude, user_longitude = helpers.parse_coordinates(location_info["location"])
+    km_near_me = location_info["kmNearMe"]
 
-            # Convert the latitude and longitude to floats
-            latitude = float(latitude.strip())
-            longitude = float(longitude.strip())
+    # Bounding box prefilter so the coordinate index only touches nearby rows
+    latitude_delta = km_near_me / constants.KM_PER_DEGREE
+    longitude_delta = km_near_me / (constants.KM_PER_DEGREE * max(math.cos(math.radians(user_latitude)), 1e-6))
+    filters = [between(latitude, user_latitude - latitude_delta, user_latitude + latitude_delta)]
 
-            # Use the haversine formula to calculate distance
-            distance = (
-                math.sqrt(
-                    pow(math.radians(latitude - user_latitude), 2) + pow(math.radians(longitude - user_longitude), 2)
-                )
-                * 6371
-            )
+    # A box wrapping around the antimeridian cannot be expressed as one range
+    if -180 <= user_longitude - longitude_delta and user_longitude + longitude_delta <= 180:
+        filters.append(between(longitude, user_longitude - longitude_delta, user_longitude + longitude_delta))
 
-            # Only keep if within the filter distance
-            if distance <= filter_distance:
-                new_results.append(result)
-    return new_results
+    # Only keep if within the filter distance
+    filters.append(get_distance_km(latitude, longitude, user_latitude, user_longitude) <= km_near_me)
+    return filters
 
 
 def validate_sort(item):
@@ -75,7 +71,10 @@ def get_event_filters(criteria: schemas.sortFilterEventListings) -> dict:
         filter_criteria["filters"] = filter_list
         # If we want just everything in 50km
         if criteria.locationCoord:
-            filter_criteria["location_info"] = {"location": criteria.locationCoord, "kmNearMe": 50}
+            filter_criteria["location_info"] = {
+                "location": criteria.locationCoord,
+                "kmNearMe": constants.DEFAULT_KM_NEAR_ME,
+            }
         return filter_criteria
 
     # Date filters
@@ -90,41 +89,40 @@ def get_event_filters(criteria: schemas.sortFilterEventListings) -> dict:
         if dateStart == dateEnd:
             dateStart = dateStart - datetime.timedelta(days=1)
             dateEnd = dateEnd + datetime.timedelta(days=1)
-        filter_list.append(between(models.Event.start_time, dateStart, dateEnd))
+        filter_list.append(between(models.EventSearchDocument.start_time, dateStart, dateEnd))
     elif filters.dateStart:
         try:
             dateStart = datetimemod.strptime(filters.dateStart, "%Y-%m-%d").date()
         except Exception:
             raise InvalidInputException("Invalid datetime format")
-        filter_list.append(models.Event.start_time >= dateStart)
+        filter_list.append(models.EventSearchDocument.start_time >= dateStart)
     elif filters.dateEnd:
         try:
             dateEnd = datetimemod.strptime(filters.dateEnd, "%Y-%m-%d").date()
         except Exception:
             raise InvalidInputException("Invalid datetime format")
-        filter_list.append(models.Event.start_time <= dateEnd)
+        filter_list.append(models.EventSearchDocument.start_time <= dateEnd)
 
     # Price filters
     if filters.priceStart and filters.priceEnd:
         if filters.priceStart > filters.priceEnd:
             raise InvalidInputException("Minimum price must be less than max price")
     if filters.priceStart:
-        filter_list.append(models.Event.minimum_cost >= filters.priceStart)
+        filter_list.append(models.EventSearchDocument.minimum_cost >= filters.priceStart)
     if filters.priceEnd:
-        filter_list.append(models.Event.minimum_cost <= filters.priceEnd)
+        filter_list.append(models.EventSearchDocument.minimum_cost <= filters.priceEnd)
 
     # Type filter
     if filters.type:
-        filter_list.append(func.lower(models.Event.event_type) == filters.type.lower())
+        filter_list.append(func.lower(models.EventSearchDocument.event_type) == filters.type.lower())
 
     # Rating filter
     if filters.ratingAtLeast:
-        filter_list.append(models.Host.rating >= filters.ratingAtLeast)
+        filter_list.append(models.EventSearchDocument.host_rating >= filters.ratingAtLeast)
 
     # Tag filter
     if filters.tags is not None and len(filters.tags) > 0:
-        or_conditions = [models.Tag.tag_name == tag for tag in filters.tags]
-        filter_list.append(or_(*or_conditions))
+        filter_list.append(models.EventSearchDocument.tags.overlap(filters.tags))
 
     # Add specification for location filters
     if not criteria.locationCoord and filters.kmNearMe:
@@ -138,9 +136,7 @@ def get_event_filters(criteria: schemas.sortFilterEventListings) -> dict:
     return filter_criteria
 
 
-def get_event_sort(sort: str, original_titles: bool = False) -> dict:
-    if not sort:
-        return {"sort_column": "", "direction": ""}
+def get_sort_criteria(sort: str):
     # Check that a valid sort option was provided
     validate_sort(sort)
 
@@ -152,11 +148,84 @@ def get_event_sort(sort: str, original_titles: bool = False) -> dict:
         SortOption.ALPHABETICAL_REVERSE.value: ("title", "desc"),
         SortOption.MOST_LIKED.value: ("noLikes", "desc"),
         SortOption.UPCOMING.value: ("startDateTime", "asc"),
+        SortOption.RELEVANCE.value: ("relevanceScore", "desc"),
+        SortOption.NEAREST.value: ("distanceKm", "asc"),
     }
 
-    if sort in sort_criteria:
-        sort_column, sort_direction = sort_criteria[sort]
+    return sort_criteria.get(sort)
+
+
+def get_event_sort(sort: str, original_titles: bool = False) -> dict:
+    if not sort:
+        return {"sort_column": "", "direction": ""}
+
+    sort_criteria = get_sort_criteria(sort)
+    if sort_criteria is not None and sort not in (SortOption.RELEVANCE.value, SortOption.NEAREST.value):
+        sort_column, sort_direction = sort_criteria
         sort_column = convert_sort_criteria(sort_column) if original_titles else sort_column
         return asc(sort_column) if sort_direction == "asc" else desc(sort_column)
     else:
         return None
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# --------------------------------------- Keyset Pagination ------------------------------------------ #
+
+
+def get_sort_key(results, sort: str):
+    # Without a sort the event id alone orders the results
+    if not sort:
+        return None, "asc"
+
+    sort_column, sort_direction = get_sort_criteria(sort)
+    sort_key = results.c[sort_column]
+    if sort_column in ("minimumCost", "noLikes"):
+        sort_key = func.coalesce(sort_key, 0)
+    elif sort_column == "distanceKm":
+        sort_key = func.coalesce(sort_key, constants.MAX_DISTANCE_KM)
+    return sort_key, sort_direction
+
+
+def get_keyset_order(sort_key, id_column, direction: str):
+    columns = [id_column] if sort_key is None else [sort_key, id_column]
+    return [asc(column) if direction == "asc" else desc(column) for column in columns]
+
+
+def get_keyset_filter(sort_key, id_column, direction: str, cursor_values: List):
+    if sort_key is None:
+        position, after = id_column, cursor_values[-1]
+    else:
+        position, after = tuple_(sort_key, id_column), tuple_(*cursor_values)
+    return position > after if direction == "asc" else position < after
+
+
+def encode_cursor(sort: str, sort_value, event_id: int) -> str:
+    # Opaque cursor holding the sort option, the last sort key and its event id
+    payload = json.dumps({"sort": sort or "", "key": sort_value, "id": event_id}, default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: str) -> List:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        sort_value, event_id = payload["key"], int(payload["id"])
+    except Exception:
+        raise InvalidInputException("Invalid search cursor")
+
+    if payload.get("sort") != (sort or ""):
+        raise InvalidInputException("Search cursor does not match the sort criteria")
+
+    if not sort:
+        return [event_id]
+
+    # Restore the type of the sort key
+    sort_column, _ = get_sort_criteria(sort)
+    try:
+        if sort_column == "startDateTime":
+            sort_value = datetimemod.fromisoformat(sort_value)
+        elif sort_column == "minimumCost":
+            sort_value = Decimal(sort_value)
+    except Exception:
+        raise InvalidInputException("Invalid search cursor")
+
+    return [sort_value, event_id]
@@ -0,0 +1,66 @@
+import re
+from datetime import datetime
+from sqlalchemy import select, func, literal, or_, union_all, desc
+
+from .. import models, schemas, constants
+from ..cache import TTLCache, clear_on_write
+from ..database import db
+from ..exceptions import InvalidInputException
+
+
+# Suggestions keyed by the normalized prefix typed so far
+suggest_cache = TTLCache(max_size=constants.SUGGEST_CACHE_SIZE, ttl=constants.SUGGEST_CACHE_SECONDS)
+clear_on_write(suggest_cache, models.Event, models.Tag, models.Host)
+
+
+def normalize_prefix(prefix: str) -> str:
+    prefix = " ".join(prefix.lower().split())
+    if not re.match(r"^[a-z0-9\s]*$", prefix):
+        raise InvalidInputException("Search characters must be alphanumeric")
+    return prefix
+
+
+def get_suggestion_query(column, suggestion_type: str, prefix: str):
+    # Substring matches are served by the trigram index, word similarity catches typos
+    return select(
+        column.label("text"),
+        literal(suggestion_type).label("type"),
+        column.ilike(f"{prefix}%").label("isPrefix"),
+        func.word_similarity(prefix, column).label("score"),
+    ).filter(or_(column.ilike(f"%{prefix}%"), literal(prefix).op("<%")(column)))
+
+
+def fetch_suggestions(prefix: str) -> schemas.SearchSuggestions:
+    title_query = get_suggestion_query(models.EventSearchDocument.title, "title", prefix).filter(
+        models.EventSearchDocument.cancelled.is_(False),
+        models.EventSearchDocument.end_time > datetime.now(),
+    )
+    tag_query = get_suggestion_query(models.Tag.tag_name, "tag", prefix)
+    # Use the hosts table directly to skip the polymorphic join onto users
+    org_name = models.Host.__table__.c.org_name
+    host_query = get_suggestion_query(org_name, "host", prefix).filter(org_name != "")
+
+    suggestions = union_all(title_query, tag_query, host_query).subquery()
+    results = db.get().execute(
+        select(suggestions)
+        .distinct()
+        .order_by(desc(suggestions.c.isPrefix), desc(suggestions.c.score), suggestions.c.text)
+        .limit(constants.SUGGESTIONS)
+    ).fetchall()
+
+    return schemas.SearchSuggestions(
+        suggestions=[schemas.SearchSuggestion(text=result.text, type=result.type) for result in results]
+    )
+
+
+def get_suggestions(prefix: str) -> schemas.SearchSuggestions:
+    prefix = normalize_prefix(prefix)
+    if len(prefix) < constants.SUGGEST_MIN_LENGTH:
+        return schemas.SearchSuggestions(suggestions=[])
+
+    suggestions = suggest_cache.get(prefix)
+    if suggestions is None:
+        suggestions = fetch_suggestions(prefix)
+        suggest_cache.set(prefix, suggestions)
+
+    return suggestions
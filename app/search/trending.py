@@ -0,0 +1,214 @@
+import asyncio
+import heapq
+import logging
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import Float, Integer, cast, column, desc, func, select, values
+from sqlalchemy.dialects.postgresql import insert
+from starlette.concurrency import run_in_threadpool
+
+from .. import models, constants, http_cache
+from ..database import db, get_db
+
+
+logger = logging.getLogger(__name__)
+
+
+class TrendingLeaderboard:
+    """
+    Upcoming event ids ordered by their time decayed activity, replaced as a whole on each refresh
+    """
+
+    def __init__(self, event_ids: List[int]):
+        self.event_ids = event_ids
+        self.refreshed_at = datetime.now()
+
+    def get_page(self, start: int, amount: Optional[int] = None) -> List[int]:
+        end = None if amount is None else start + amount
+        return self.event_ids[start:end]
+
+
+class TagTrendingIndex:
+    """
+    The top trending upcoming event ids and the number of upcoming events for every tag
+    """
+
+    def __init__(self, tag_names: List[str], event_tags: List, positions: Dict[int, int]):
+        tag_event_ids = {tag_name: [] for tag_name in tag_names}
+        for event_id, tag_name in event_tags:
+            tag_event_ids[tag_name].append(event_id)
+
+        # Events created since the leaderboard was refreshed go last
+        unranked = len(positions)
+        self.event_ids = {
+            tag_name: heapq.nsmallest(
+                constants.TRENDING, event_ids, key=lambda event_id: (positions.get(event_id, unranked), event_id)
+            )
+            for tag_name, event_ids in tag_event_ids.items()
+        }
+        self.event_counts = {tag_name: len(event_ids) for tag_name, event_ids in tag_event_ids.items()}
+
+        self.tags_by_name = sorted(tag_names)
+        self.tags_by_popularity = sorted(tag_names, key=lambda tag_name: (-self.event_counts[tag_name], tag_name))
+        # Built from the tags and counts alone so every worker gives the same index the same tag
+        counts = [self.event_counts[tag_name] for tag_name in self.tags_by_name]
+        self.etag = http_cache.get_etag(self.tags_by_name, counts)
+
+    def get_tags(self, order: constants.TagOrder) -> List[str]:
+        return self.tags_by_popularity if order == constants.TagOrder.POPULAR else self.tags_by_name
+
+
+leaderboard: Optional[TrendingLeaderboard] = None
+
+# Rebuilt with the leaderboard by the periodic job, new tags and tagged events show from its next run
+tag_index: Optional[TagTrendingIndex] = None
+
+# Event views counted in memory and written to the activity log by the periodic job
+event_views = Counter()
+event_views_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# -------------------------------------------  Activity  --------------------------------------------- #
+
+
+def record_event_view(event_id: int):
+    with event_views_lock:
+        event_views[event_id] += 1
+
+
+def flush_event_views():
+    global event_views
+    with event_views_lock:
+        views, event_views = event_views, Counter()
+    if not views:
+        return
+
+    # Join on events so views of events deleted since they were counted are dropped
+    counted = values(column("event_id", Integer), column("views", Integer), name="counted_views").data(
+        list(views.items())
+    )
+    rows = select(counted.c.event_id, func.current_date(), counted.c.views).join(
+        models.Event, models.Event.event_id == counted.c.event_id
+    )
+    log = models.EventActivityLog.__table__
+    upsert = insert(log).from_select(["event_id", "date", "views"], rows)
+    db.get().execute(
+        upsert.on_conflict_do_update(
+            index_elements=[log.c.event_id, log.c.date], set_={"views": log.c.views + upsert.excluded.views}
+        )
+    )
+
+
+def get_trending_score():
+    log = models.EventActivityLog
+    activity = (
+        func.coalesce(log.likes, 0) * constants.TRENDING_LIKE_WEIGHT
+        + func.coalesce(log.bookings, 0) * constants.TRENDING_BOOKING_WEIGHT
+        + func.coalesce(log.views, 0) * constants.TRENDING_VIEW_WEIGHT
+    )
+
+    # Activity halves in weight every half life
+    age_days = cast(func.current_date() - log.date, Float)
+    return func.sum(activity * func.power(0.5, age_days * (1.0 / constants.TRENDING_HALF_LIFE_DAYS)))
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# -----------------------------------------  Leaderboard  -------------------------------------------- #
+
+
+def refresh_leaderboard() -> TrendingLeaderboard:
+    global leaderboard, tag_index
+    log = models.EventActivityLog
+    scores = (
+        select(log.event_id, get_trending_score().label("score"))
+        .where(log.date > date.today() - timedelta(days=constants.TRENDING_WINDOW_DAYS))
+        .group_by(log.event_id)
+        .subquery()
+    )
+
+    # Events without recent activity follow in order of their total likes
+    event_ids = (
+        db.get()
+        .query(models.Event.event_id)
+        .outerjoin(scores, scores.c.event_id == models.Event.event_id)
+        .filter(models.Event.cancelled.is_(False))
+        .filter(models.Event.end_time > datetime.now())
+        .order_by(desc(func.coalesce(scores.c.score, 0)), desc(models.Event.likes), models.Event.event_id)
+        .all()
+    )
+
+    # Both are swapped together so the tag index always ranks by the leaderboard being served
+    event_ids = [item[0] for item in event_ids]
+    leaderboard, tag_index = TrendingLeaderboard(event_ids), build_tag_index(event_ids)
+    return leaderboard
+
+
+def get_leaderboard() -> TrendingLeaderboard:
+    # The periodic job keeps this fresh, only build it here before its first run
+    return leaderboard or refresh_leaderboard()
+
+
+def clear_leaderboard():
+    global leaderboard, tag_index
+    leaderboard, tag_index = None, None
+
+
+def build_tag_index(event_ids: List[int]) -> TagTrendingIndex:
+    tag_names = db.get().query(models.Tag.tag_name).all()
+    event_tags = (
+        db.get()
+        .query(models.EventTag.event_id, models.Tag.tag_name)
+        .join(models.Tag, models.Tag.tag_id == models.EventTag.tag_id)
+        .join(models.Event, models.Event.event_id == models.EventTag.event_id)
+        .filter(models.Event.cancelled.is_(False))
+        .filter(models.Event.end_time > datetime.now())
+        .all()
+    )
+
+    positions = {event_id: position for position, event_id in enumerate(event_ids)}
+    return TagTrendingIndex([item[0] for item in tag_names], event_tags, positions)
+
+
+def get_tag_index() -> TagTrendingIndex:
+    # Like the leaderboard, only built here before the periodic job's first run
+    if tag_index is None:
+        refresh_leaderboard()
+    return tag_index
+
+
+def get_trending_event_ids(start: int, amount: Optional[int] = None) -> List[int]:
+    return get_leaderboard().get_page(start, amount)
+
+
+def get_trending_tag_event_ids(tag_name: str) -> List[int]:
+    return get_tag_index().event_ids.get(tag_name, [])
+
+
+def get_upcoming_filters() -> List:
+    # Skip events cancelled or finished since the last refresh
+    return [models.Event.cancelled.is_(False), models.Event.end_time > datetime.now()]
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ------------------------------------------  Periodic Job  ------------------------------------------ #
+
+
+def run_trending_job():
+    with get_db() as session:
+        db.set(session)
+        flush_event_views()
+        session.commit()
+        refresh_leaderboard()
+
+
+async def refresh_trending_periodically():
+    while True:
+        try:
+            await run_in_threadpool(run_trending_job)
+        except Exception:
+            logger.exception("Failed to refresh the trending leaderboard")
+        await asyncio.sleep(constants.TRENDING_REFRESH_SECONDS)
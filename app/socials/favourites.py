@@ -1,20 +1,25 @@
+from typing import List
+from fastapi.responses import StreamingResponse
 from .. import models, schemas, constants, exceptions
 from ..database import db
-from ..events import event_preview
+from ..events import event_preview, event_stream
 from . import socials_db
 
 
-def get_user_favourites(user: models.User) -> schemas.EventListingPreviewList:
+def get_user_favourite_ids(user: models.User) -> List[int]:
 
     if user.user_type != constants.CUSTOMER:
         raise exceptions.ForbiddenAccessException("Only customers can favourite events.")
 
-    return schemas.EventListingPreviewList(
-        eventListings=[
-            event_preview.get_event_preview(favourited_event.event)
-            for favourited_event in user.customer.favourited_events
-        ]
-    )
+    return [favourited_event.event_id for favourited_event in user.customer.favourited_events]
+
+
+def get_user_favourites(user: models.User) -> schemas.EventListingPreviewList:
+    return schemas.EventListingPreviewList(eventListings=event_preview.get_event_previews(get_user_favourite_ids(user)))
+
+
+def get_user_favourites_stream(user: models.User) -> StreamingResponse:
+    return event_stream.get_preview_stream(get_user_favourite_ids(user))
 
 
 def like_event(event_id: int, user_id: int) -> None:
@@ -138,14 +138,16 @@ def dislike_reviews(review_id: int) -> None:
 # -----------------------------------------  Get Review Information ---------------------------------------------- #
 
 
-def get_review_details(review: models.EventReview, user_id: int) -> schemas.ReviewDetails:
+def get_review_details(
+    review: models.EventReview, user_id: int, event_info: schemas.EventListingPreview = None
+) -> schemas.ReviewDetails:
 
     # Only users can like events
     is_user = db.get().query(models.Customer).filter(models.Customer.customer_id == user_id).first()
     user_liked_info = check_user_liked_reviews(user_id, review.review_id) if is_user else None
 
     return schemas.ReviewDetails(
-        eventInfo=event_preview.get_event_preview(review.event),
+        eventInfo=event_info or event_preview.get_event_previews([review.event_id])[0],
         rating=review.rating,
         review=review.review,
         reviewId=review.review_id,
@@ -171,18 +173,20 @@ def get_event_reviews(eventListingId: int, user: models.User) -> schemas.AllRevi
         .filter(models.EventReview.event_id == eventListingId)
         .all()
     )
+    # Every review is of the same event so its preview is loaded once
+    event_info = event_preview.get_event_previews_by_id([eventListingId]).get(eventListingId)
     return schemas.AllReviewsWithDetail(
         reviews=[
-            get_review_details(review, user.user_id)
+            get_review_details(review, user.user_id if user else None, event_info)
             for review in all_reviews
         ]
     )
 
 
-def get_review_details_with_event_preview(review: models.EventReview, user_id: int) -> schemas.ReviewDetails:
-    review_details = get_review_details(review, user_id)
-    review_details.eventInfo = event_preview.get_event_preview(review.event)
-    return review_details
+def get_review_details_with_event_preview(
+    review: models.EventReview, user_id: int, event_info: schemas.EventListingPreview = None
+) -> schemas.ReviewDetails:
+    return get_review_details(review, user_id, event_info)
 
 
 def get_review(review_id: int) -> models.EventReview:
@@ -1,6 +1,6 @@
-from .. import models, schemas
+from .. import models, schemas, constants
 from ..database import db
-from .. import exceptions
+from .. import exceptions, helpers
 from typing import List
 
 
@@ -9,8 +9,16 @@ from typing import List
 
 
 def create_base_venue(venue_info: schemas.Venue):
+    # Venues without coordinates are stored without a position rather than rejected
+    latitude, longitude = None, None
+    if venue_info.locationCoords:
+        latitude, longitude = helpers.parse_coordinates(venue_info.locationCoords)
     new_venue = models.Venue(
-        name=venue_info.name, location=venue_info.location, location_coords=venue_info.locationCoords
+        name=venue_info.name,
+        location=venue_info.location,
+        location_coords=venue_info.locationCoords,
+        latitude=latitude,
+        longitude=longitude,
     )
     db.get().add(new_venue)
     db.get().flush()
@@ -54,6 +62,16 @@ def get_venues():
         raise exceptions.BadGatewayException()
 
 
+def get_venues_version() -> int:
+    version = (
+        db.get()
+        .query(models.ContentVersion.version)
+        .filter(models.ContentVersion.name == constants.VENUES_CONTENT)
+        .scalar()
+    )
+    return version or 0
+
+
 def get_venue_sections(venue_id: int) -> models.VenueSection:
     try:
         return db.get().query(models.VenueSection).filter(models.VenueSection.venue_id == venue_id).all()
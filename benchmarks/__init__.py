@@ -0,0 +1,10 @@
+"""
+Benchmarks for search and recommendations against a synthetic catalogue.
+
+Generate a catalogue into an empty database set up with database/database.sql and
+database/triggers.sql, then run the benchmark suite:
+
+    python -m benchmarks.catalogue --scale medium --seed 42
+    python -m benchmarks.run --iterations 20 --output results.json
+    python -m benchmarks.run --baseline results.json
+"""
@@ -0,0 +1,272 @@
+import argparse
+import random
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app import constants, models
+from app.database import SQLALCHEMY_DATABASE_URL
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# --------------------------------------------  Sizes  ----------------------------------------------- #
+
+
+@dataclass
+class CatalogueSize:
+    customers: int
+    hosts: int
+    venues: int
+    events: int
+    tags: int
+    tags_per_event: int
+    likes_per_customer: int
+    follows_per_customer: int
+    bookings_per_customer: int
+
+
+SCALES = {
+    "small": CatalogueSize(
+        customers=200,
+        hosts=20,
+        venues=10,
+        events=1_000,
+        tags=30,
+        tags_per_event=3,
+        likes_per_customer=10,
+        follows_per_customer=3,
+        bookings_per_customer=3,
+    ),
+    "medium": CatalogueSize(
+        customers=2_000,
+        hosts=200,
+        venues=50,
+        events=10_000,
+        tags=100,
+        tags_per_event=4,
+        likes_per_customer=20,
+        follows_per_customer=5,
+        bookings_per_customer=5,
+    ),
+    "large": CatalogueSize(
+        customers=20_000,
+        hosts=1_000,
+        venues=200,
+        events=100_000,
+        tags=300,
+        tags_per_event=5,
+        likes_per_customer=30,
+        follows_per_customer=8,
+        bookings_per_customer=8,
+    ),
+}
+
+# Events are spread around these (latitude, longitude) city centres
+CITIES = [
+    ("Sydney", -33.8688, 151.2093),
+    ("Melbourne", -37.8136, 144.9631),
+    ("Brisbane", -27.4698, 153.0251),
+    ("Perth", -31.9523, 115.8613),
+    ("Adelaide", -34.9285, 138.6007),
+]
+
+WORDS = [
+    "jazz", "rock", "indie", "comedy", "festival", "market", "workshop", "night", "garden", "harbour",
+    "food", "wine", "coffee", "tech", "startup", "art", "gallery", "film", "theatre", "dance",
+    "yoga", "run", "charity", "gala", "concert", "orchestra", "book", "poetry", "science", "history",
+]
+
+BATCH_SIZE = 1_000
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ------------------------------------------  Generator  --------------------------------------------- #
+
+
+def get_text(rng: random.Random, num_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(num_words))
+
+
+def get_coordinates(rng: random.Random):
+    name, latitude, longitude = rng.choice(CITIES)
+    latitude += rng.uniform(-0.5, 0.5)
+    longitude += rng.uniform(-0.5, 0.5)
+    return name, latitude, longitude
+
+
+def add_in_batches(session: Session, rows: List):
+    for start in range(0, len(rows), BATCH_SIZE):
+        session.add_all(rows[start : start + BATCH_SIZE])
+        session.flush()
+
+
+def insert_in_batches(session: Session, table, rows: List[dict]):
+    # Plain inserts for link tables, the likes model only keys on the customer
+    for start in range(0, len(rows), BATCH_SIZE):
+        session.execute(insert(table), rows[start : start + BATCH_SIZE])
+
+
+def generate_users(session: Session, size: CatalogueSize, rng: random.Random):
+    customers = [
+        models.Customer(
+            first_name="Bench",
+            last_name=f"Customer{index}",
+            username=f"bench_customer_{index}",
+            email=f"bench_customer_{index}@eventstar.bench",
+            password="",
+            user_type=constants.CUSTOMER,
+        )
+        for index in range(size.customers)
+    ]
+    hosts = [
+        models.Host(
+            first_name="Bench",
+            last_name=f"Host{index}",
+            username=f"bench_host_{index}",
+            email=f"bench_host_{index}@eventstar.bench",
+            org_email=f"bench_org_{index}@eventstar.bench",
+            password="",
+            user_type=constants.HOST,
+            org_name=f"{get_text(rng, 2).title()} Events {index}",
+        )
+        for index in range(size.hosts)
+    ]
+    add_in_batches(session, customers)
+    add_in_batches(session, hosts)
+    return customers, hosts
+
+
+def generate_venues(session: Session, size: CatalogueSize, rng: random.Random):
+    venues = []
+    for index in range(size.venues):
+        city, latitude, longitude = get_coordinates(rng)
+        venues.append(
+            models.Venue(
+                name=f"{city} Venue {index}",
+                location=city,
+                location_coords=f"({latitude}, {longitude})",
+                latitude=latitude,
+                longitude=longitude,
+            )
+        )
+    add_in_batches(session, venues)
+    return venues
+
+
+def generate_tags(session: Session, size: CatalogueSize):
+    tags = [models.Tag(tag_name=f"{WORDS[index % len(WORDS)]}{index // len(WORDS) or ''}") for index in range(size.tags)]
+    add_in_batches(session, tags)
+    return tags
+
+
+def generate_events(session: Session, size: CatalogueSize, rng: random.Random, hosts, venues, tags):
+    now = datetime.now()
+    event_types = [constants.ONLINE, constants.INPERSON, constants.SEATED]
+
+    events = []
+    for _ in range(size.events):
+        # Mostly upcoming events with some already finished
+        start_time = now + timedelta(days=rng.uniform(-30, 180))
+        events.append(
+            models.Event(
+                host_id=rng.choice(hosts).host_id,
+                title=get_text(rng, 3).title(),
+                summary=get_text(rng, 8),
+                description=get_text(rng, 40),
+                start_time=start_time,
+                end_time=start_time + timedelta(hours=rng.randint(1, 8)),
+                event_capacity=rng.randint(10, 1000),
+                minimum_cost=rng.choice([0, 0, 10, 20, 35, 50, 80, 120, 250]),
+                event_type=rng.choice(event_types),
+                cancelled=rng.random() < 0.02,
+            )
+        )
+    add_in_batches(session, events)
+
+    type_rows = []
+    event_tags = []
+    for event in events:
+        if event.event_type == constants.ONLINE:
+            type_rows.append(models.OnlineEvent(online_event_id=event.event_id, online_link="https://eventstar.bench"))
+        elif event.event_type == constants.INPERSON:
+            city, latitude, longitude = get_coordinates(rng)
+            type_rows.append(
+                models.NotSeatedEvent(
+                    not_seated_event_id=event.event_id,
+                    location=city,
+                    location_coords=f"({latitude}, {longitude})",
+                    latitude=latitude,
+                    longitude=longitude,
+                )
+            )
+        else:
+            type_rows.append(models.SeatedEvent(seated_event_id=event.event_id, venue_id=rng.choice(venues).venue_id))
+
+        for tag in rng.sample(tags, min(size.tags_per_event, len(tags))):
+            event_tags.append({"event_id": event.event_id, "tag_id": tag.tag_id})
+
+    add_in_batches(session, type_rows)
+    insert_in_batches(session, models.EventTag.__table__, event_tags)
+    return events
+
+
+def generate_interactions(session: Session, size: CatalogueSize, rng: random.Random, customers, hosts, events):
+    # Popularity is skewed so a few events and hosts collect most interactions
+    event_weights = [1 / (rank + 1) for rank in range(len(events))]
+    host_weights = [1 / (rank + 1) for rank in range(len(hosts))]
+
+    likes, follows, bookings = [], [], []
+    for customer in customers:
+        liked = {event.event_id for event in rng.choices(events, event_weights, k=size.likes_per_customer)}
+        likes.extend({"customer_id": customer.customer_id, "event_id": event_id} for event_id in liked)
+
+        followed = {host.host_id for host in rng.choices(hosts, host_weights, k=size.follows_per_customer)}
+        follows.extend({"customer_id": customer.customer_id, "host_id": host_id} for host_id in followed)
+
+        for event in rng.choices(events, event_weights, k=size.bookings_per_customer):
+            bookings.append(
+                models.Booking(
+                    event_id=event.event_id,
+                    customer_id=customer.customer_id,
+                    date=event.start_time - timedelta(days=rng.randint(1, 30)),
+                    total_cost=event.minimum_cost,
+                    total_quantity=1,
+                    referral_code=None,
+                )
+            )
+
+    insert_in_batches(session, models.Like.__table__, likes)
+    insert_in_batches(session, models.Follower.__table__, follows)
+    add_in_batches(session, bookings)
+
+
+def generate_catalogue(session: Session, size: CatalogueSize, seed: int):
+    rng = random.Random(seed)
+    customers, hosts = generate_users(session, size, rng)
+    venues = generate_venues(session, size, rng)
+    tags = generate_tags(session, size)
+    events = generate_events(session, size, rng, hosts, venues, tags)
+    generate_interactions(session, size, rng, customers, hosts, events)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Eventstar catalogue for benchmarking.")
+    parser.add_argument("--scale", choices=SCALES.keys(), default="small", help="Size of the catalogue")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed so catalogues are reproducible")
+    parser.add_argument("--events", type=int, help="Override the number of events for the scale")
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL, help="Database to fill")
+    args = parser.parse_args()
+
+    size = SCALES[args.scale]
+    if args.events:
+        size = replace(size, events=args.events)
+
+    engine = create_engine(args.database_url)
+    with Session(engine) as session:
+        generate_catalogue(session, size, args.seed)
+        session.commit()
+
+    print(f"Generated {args.scale} catalogue with {size.events} events (seed {args.seed})")
@@ -0,0 +1,222 @@
+import argparse
+import itertools
+import json
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, event, select, func
+from sqlalchemy.orm import Session
+
+from app import constants, models, schemas
+from app.constants import SortOption
+from app.database import SQLALCHEMY_DATABASE_URL, db
+from app.search import map_clusters, recommend, search, suggest, trending
+
+
+# Searches are centred on Sydney like most of the generated catalogue
+LOCATION = "(-33.8688, 151.2093)"
+
+SEARCH_QUERIES = ["", "jazz", "rock night"]
+
+SEARCH_FILTERS = {
+    "none": None,
+    "tags": schemas.FilterListings(tags=["jazz", "food", "art"]),
+    "price": schemas.FilterListings(priceStart=10, priceEnd=100),
+    "type": schemas.FilterListings(type="inpersonSeated"),
+    "date": schemas.FilterListings(dateStart="2000-01-01", dateEnd="2100-01-01"),
+    "rating": schemas.FilterListings(ratingAtLeast=1),
+    "nearMe": schemas.FilterListings(kmNearMe=25),
+}
+
+
+@dataclass
+class BenchmarkCase:
+    name: str
+    run: Callable[[], object]
+    # Runs and commits once before the timed iterations
+    setup: Optional[Callable[[], object]] = None
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    iterations: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    queries: float
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# ---------------------------------------------  Cases  ---------------------------------------------- #
+
+
+def get_search_cases(user_id: int) -> List[BenchmarkCase]:
+    cases = []
+    sorts = [""] + [option.value for option in SortOption]
+    for query, sort, (filter_name, filters) in itertools.product(SEARCH_QUERIES, sorts, SEARCH_FILTERS.items()):
+        criteria = schemas.sortFilterEventListings(
+            searchQuery=query, sort=sort, filter=filters, locationCoord=LOCATION, facets=False
+        )
+        name = f"search[q={query or '-'},sort={sort or '-'},filter={filter_name}]"
+        cases.append(BenchmarkCase(name, lambda criteria=criteria: search.run_search_query(criteria, user_id)))
+
+    facet_criteria = schemas.sortFilterEventListings(searchQuery="", sort="upcoming", facets=True)
+    cases.append(BenchmarkCase("search[facets]", lambda: search.run_search_query(facet_criteria)))
+    return cases
+
+
+def get_recommendation_cases(user_id: int) -> List[BenchmarkCase]:
+    return [
+        BenchmarkCase("recommend.get_generic_results", lambda: recommend.get_generic_results(0)),
+        BenchmarkCase(
+            "recommend.get_scored_recommendations",
+            lambda: recommend.get_scored_recommendations(user_id, constants.SEARCH_RESULTS),
+        ),
+        BenchmarkCase(
+            "recommend.get_recommended_events[stored]",
+            lambda: recommend.get_recommended_events(user_id, 0),
+            setup=lambda: recommend.refresh_user_recommendations(user_id),
+        ),
+        BenchmarkCase(
+            "recommend.refresh_user_recommendations", lambda: recommend.refresh_user_recommendations(user_id)
+        ),
+    ]
+
+
+def get_discovery_cases() -> List[BenchmarkCase]:
+    city = schemas.MapViewport(north=-33.5, south=-34.2, east=151.6, west=150.8, zoom=9)
+    country = schemas.MapViewport(north=-10, south=-44, east=154, west=112, zoom=3)
+    return [
+        BenchmarkCase("map_clusters[city]", lambda: map_clusters.get_map_clusters(city)),
+        BenchmarkCase("map_clusters[country]", lambda: map_clusters.get_map_clusters(country)),
+        BenchmarkCase("suggest[ja]", lambda: suggest.get_suggestions("ja")),
+        BenchmarkCase("suggest[jaz nite]", lambda: suggest.get_suggestions("jaz nite")),
+    ]
+
+
+def clear_caches():
+    search.search_cache.clear()
+    map_clusters.tile_cache.clear()
+    suggest.suggest_cache.clear()
+    trending.clear_leaderboard()
+
+
+# ---------------------------------------------------------------------------------------------------- #
+# --------------------------------------------  Runner  ---------------------------------------------- #
+
+
+def get_percentile(timings: List[float], percentile: int) -> float:
+    if len(timings) == 1:
+        return timings[0]
+    return statistics.quantiles(timings, n=100, method="inclusive")[percentile - 1]
+
+
+def run_case(session: Session, case: BenchmarkCase, iterations: int, warm: bool, query_count: List[int]):
+    if case.setup:
+        case.setup()
+        session.commit()
+
+    timings = []
+    queries = []
+    for _ in range(iterations):
+        if not warm:
+            clear_caches()
+
+        query_count[0] = 0
+        start = time.perf_counter()
+        case.run()
+        timings.append((time.perf_counter() - start) * 1000)
+        queries.append(query_count[0])
+        session.rollback()
+
+    return BenchmarkResult(
+        name=case.name,
+        iterations=iterations,
+        p50_ms=get_percentile(timings, 50),
+        p95_ms=get_percentile(timings, 95),
+        p99_ms=get_percentile(timings, 99),
+        max_ms=max(timings),
+        queries=statistics.mean(queries),
+    )
+
+
+def print_results(results: List[BenchmarkResult], baseline: Dict[str, dict]):
+    print(f"{'case':<60} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'queries':>8} {'vs base':>8}")
+    for result in results:
+        change = ""
+        if result.name in baseline:
+            change = f"{result.p95_ms / max(baseline[result.name]['p95_ms'], 1e-6):.2f}x"
+        print(
+            f"{result.name:<60} {result.p50_ms:>9.2f} {result.p95_ms:>9.2f} {result.p99_ms:>9.2f} "
+            f"{result.max_ms:>9.2f} {result.queries:>8.1f} {change:>8}"
+        )
+
+
+def get_regressions(results: List[BenchmarkResult], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    for result in results:
+        previous = baseline.get(result.name)
+        if previous is None:
+            continue
+        if result.p95_ms > previous["p95_ms"] * tolerance or result.queries > previous["queries"]:
+            regressions.append(result.name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Eventstar search and recommendations.")
+    parser.add_argument("--iterations", "-n", type=int, default=20, help="Runs per benchmark case")
+    parser.add_argument("--match", "-k", default="", help="Only run cases whose name contains this text")
+    parser.add_argument("--warm", action="store_true", help="Keep the in-process caches between runs")
+    parser.add_argument("--output", "-o", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", "-b", help="JSON results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.2, help="Allowed p95 slowdown against the baseline")
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL, help="Database with a generated catalogue")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+
+    # Count the statements sent to the database by each call
+    query_count = [0]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        query_count[0] += 1
+
+    with Session(engine) as session:
+        db.set(session)
+
+        # Benchmark the personalised paths as the most active customer
+        user_id = session.execute(
+            select(models.Like.customer_id).group_by(models.Like.customer_id).order_by(func.count().desc()).limit(1)
+        ).scalar()
+        if user_id is None:
+            sys.exit("No customers found, generate a catalogue with benchmarks.catalogue first")
+
+        cases = get_search_cases(user_id) + get_recommendation_cases(user_id) + get_discovery_cases()
+        cases = [case for case in cases if args.match in case.name]
+
+        results = [run_case(session, case, args.iterations, args.warm, query_count) for case in cases]
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = {result["name"]: result for result in json.load(baseline_file)}
+
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump([result.__dict__ for result in results], output_file, indent=2)
+
+    regressions = get_regressions(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regressions against {args.baseline}:")
+        for name in regressions:
+            print(f"  {name}")
+        sys.exit(1)
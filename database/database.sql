@@ -1,3 +1,11 @@
+-----------------------------------------------------------------------------
+-------------------------------- Extensions ---------------------------------
+
+
+-- Trigram matching for search suggestions
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+
 -----------------------------------------------------------------------------
 ------------------------------- User Accounts -------------------------------
 
@@ -37,9 +45,15 @@ CREATE TABLE hosts (
     banner TEXT,
     num_followers INTEGER DEFAULT 0,
     rating NUMERIC(10, 2) DEFAULT 0,
-    num_events INTEGER DEFAULT 0
+    num_events INTEGER DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    -- number of reviews with each rating from 0 to 5
+    rating_counts INTEGER[] NOT NULL DEFAULT '{0,0,0,0,0,0}'
 );
 
+CREATE INDEX ix_hosts_org_name_trgm ON hosts USING GIN (org_name gin_trgm_ops);
+
 -- Followers table
 DROP TABLE IF EXISTS followers CASCADE;
 CREATE TABLE followers (
@@ -48,6 +62,20 @@ CREATE TABLE followers (
     PRIMARY KEY (host_id, customer_id)
 );
 
+-- Version of each host's public profile, bumped by triggers whenever the host or any of their events change
+DROP TABLE IF EXISTS host_versions CASCADE;
+CREATE TABLE host_versions (
+    host_id INTEGER PRIMARY KEY REFERENCES hosts(host_id) ON DELETE CASCADE,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+-- Version of listings served whole such as all venues, bumped by triggers on writes to their tables
+DROP TABLE IF EXISTS content_versions CASCADE;
+CREATE TABLE content_versions (
+    name VARCHAR(255) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
 
 -----------------------------------------------------------------------------
 -------------------------------- Venues -------------------------------------
@@ -59,9 +87,13 @@ CREATE TABLE venues (
     venue_id SERIAL PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
     location VARCHAR(255) NOT NULL, 
-    location_coords VARCHAR(255) NOT NULL
+    location_coords VARCHAR(255) NOT NULL,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION
 );
 
+CREATE INDEX ix_venues_coordinates ON venues (latitude, longitude);
+
 -- venue_sections table
 DROP TABLE IF EXISTS venue_sections CASCADE;
 CREATE TABLE venue_sections (
@@ -113,7 +145,11 @@ CREATE TABLE events (
     edited BOOLEAN DEFAULT FALSE,
     cancelled BOOLEAN DEFAULT FALSE,
     thumbnail TEXT,
-    survey_made BOOLEAN DEFAULT FALSE
+    survey_made BOOLEAN DEFAULT FALSE,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    -- number of reviews with each rating from 0 to 5
+    rating_counts INTEGER[] NOT NULL DEFAULT '{0,0,0,0,0,0}'
 );
 
 -- Online events table
@@ -137,7 +173,18 @@ DROP TABLE IF EXISTS not_seated_events CASCADE;
 CREATE TABLE not_seated_events (
     not_seated_event_id INTEGER PRIMARY KEY REFERENCES events(event_id),
     location VARCHAR(255) NOT NULL, 
-    location_coords VARCHAR(255) NOT NULL
+    location_coords VARCHAR(255) NOT NULL,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION
+);
+
+CREATE INDEX ix_not_seated_events_coordinates ON not_seated_events (latitude, longitude);
+
+-- Version of each event's details, bumped by triggers whenever the event or its details change
+DROP TABLE IF EXISTS event_versions CASCADE;
+CREATE TABLE event_versions (
+    event_id INTEGER PRIMARY KEY REFERENCES events(event_id) ON DELETE CASCADE,
+    version INTEGER NOT NULL DEFAULT 0
 );
 
 
@@ -181,6 +228,8 @@ CREATE TABLE tags (
     tag_name VARCHAR(255) NOT NULL UNIQUE
 );
 
+CREATE INDEX ix_tags_tag_name_trgm ON tags USING GIN (tag_name gin_trgm_ops);
+
 -- Event tags table
 DROP TABLE IF EXISTS event_tags CASCADE;
 CREATE TABLE event_tags (
@@ -190,6 +239,40 @@ CREATE TABLE event_tags (
 );
 
 
+-----------------------------------------------------------------------------
+------------------------------ Events - Search ------------------------------
+
+
+-- Event search documents table, one row per event kept in sync by triggers
+DROP TABLE IF EXISTS event_search_documents CASCADE;
+CREATE TABLE event_search_documents (
+    event_id INTEGER PRIMARY KEY REFERENCES events(event_id) ON DELETE CASCADE,
+    host_id INTEGER REFERENCES hosts(host_id),
+    org_name VARCHAR(255),
+    num_followers INTEGER DEFAULT 0,
+    host_rating NUMERIC(10, 2) DEFAULT 0,
+    title VARCHAR(255) NOT NULL,
+    thumbnail TEXT,
+    event_type VARCHAR(100) NOT NULL,
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    minimum_cost NUMERIC(10, 2),
+    likes INTEGER DEFAULT 0,
+    cancelled BOOLEAN DEFAULT FALSE,
+    location VARCHAR(255),
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    tags VARCHAR(255)[] NOT NULL DEFAULT '{}',
+    search_vector TSVECTOR
+);
+
+CREATE INDEX ix_event_search_documents_search_vector ON event_search_documents USING GIN (search_vector);
+CREATE INDEX ix_event_search_documents_tags ON event_search_documents USING GIN (tags);
+CREATE INDEX ix_event_search_documents_title_trgm ON event_search_documents USING GIN (title gin_trgm_ops);
+CREATE INDEX ix_event_search_documents_coordinates ON event_search_documents (latitude, longitude);
+CREATE INDEX ix_event_search_documents_end_time ON event_search_documents (end_time);
+
+
 -----------------------------------------------------------------------------
 --------------------------- Events - User Input -----------------------------
 
@@ -458,3 +541,47 @@ CREATE TABLE host_daily_sales (
     sales NUMERIC(10, 2) DEFAULT 0,
     PRIMARY KEY (host_id, date)
 );
+
+
+DROP TABLE IF EXISTS event_activity_log CASCADE;
+CREATE TABLE event_activity_log (
+    event_id INTEGER REFERENCES events(event_id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    likes INTEGER DEFAULT 0,
+    bookings INTEGER DEFAULT 0,
+    views INTEGER DEFAULT 0,
+    PRIMARY KEY (event_id, date)
+);
+
+CREATE INDEX ix_event_activity_log_date ON event_activity_log (date);
+
+
+-----------------------------------------------------------------------------
+---------------------------- Recommendations --------------------------------
+
+
+-- Top recommended events per customer
+DROP TABLE IF EXISTS user_recommendations CASCADE;
+CREATE TABLE user_recommendations (
+    customer_id INTEGER REFERENCES customers(customer_id),
+    event_id INTEGER REFERENCES events(event_id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    score DOUBLE PRECISION NOT NULL,
+    latest_event_id INTEGER NOT NULL,
+    PRIMARY KEY (customer_id, event_id)
+);
+
+CREATE INDEX ix_user_recommendations_rank ON user_recommendations (customer_id, rank);
+
+
+-- Most similar events by customers who booked, liked or favourited both
+DROP TABLE IF EXISTS event_neighbours CASCADE;
+CREATE TABLE event_neighbours (
+    event_id INTEGER REFERENCES events(event_id) ON DELETE CASCADE,
+    neighbour_id INTEGER REFERENCES events(event_id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    score DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (event_id, neighbour_id)
+);
+
+CREATE INDEX ix_event_neighbours_rank ON event_neighbours (event_id, rank);
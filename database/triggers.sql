@@ -76,6 +76,207 @@ AFTER INSERT OR DELETE ON dislikes
 FOR EACH ROW EXECUTE PROCEDURE update_event_dislikes();
 
 
+-----------------------------------------------------------------------------
+------------------------------- Event Search --------------------------------
+
+-- Weighted full text document for an event: title, then tags and host
+-- organisation name, then summary and finally the description
+CREATE OR REPLACE FUNCTION event_search_vector(e events)
+RETURNS tsvector AS $$
+DECLARE
+    tag_text TEXT;
+    org_text TEXT;
+BEGIN
+    SELECT string_agg(t.tag_name, ' ') INTO tag_text
+    FROM   event_tags AS et
+    JOIN   tags AS t ON t.tag_id = et.tag_id
+    WHERE  et.event_id = e.event_id;
+
+    SELECT h.org_name INTO org_text
+    FROM   hosts AS h
+    WHERE  h.host_id = e.host_id;
+
+    RETURN setweight(to_tsvector('english', coalesce(e.title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(tag_text, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(org_text, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(e.summary, '')), 'C')
+        || setweight(to_tsvector('english', coalesce(e.description, '')), 'D');
+END
+$$ LANGUAGE plpgsql STABLE;
+
+-- Rebuild the search document of an event from its host, location and tags
+CREATE OR REPLACE FUNCTION refresh_event_search_document(document_event_id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO event_search_documents (
+        event_id, host_id, org_name, num_followers, host_rating, title, thumbnail, event_type, start_time,
+        end_time, minimum_cost, likes, cancelled, location, latitude, longitude, tags, search_vector
+    )
+    SELECT e.event_id, e.host_id, h.org_name, h.num_followers, h.rating, e.title, e.thumbnail, e.event_type,
+           e.start_time, e.end_time, e.minimum_cost, e.likes, e.cancelled,
+           coalesce(nse.location, v.location),
+           coalesce(nse.latitude, v.latitude),
+           coalesce(nse.longitude, v.longitude),
+           ARRAY(
+               SELECT t.tag_name
+               FROM   event_tags AS et
+               JOIN   tags AS t ON t.tag_id = et.tag_id
+               WHERE  et.event_id = e.event_id
+           ),
+           event_search_vector(e)
+    FROM   events AS e
+    JOIN   hosts AS h ON h.host_id = e.host_id
+    LEFT JOIN not_seated_events AS nse ON nse.not_seated_event_id = e.event_id
+    LEFT JOIN seated_events AS se ON se.seated_event_id = e.event_id
+    LEFT JOIN venues AS v ON v.venue_id = se.venue_id
+    WHERE  e.event_id = document_event_id
+    ON CONFLICT (event_id) DO UPDATE
+    SET    host_id = EXCLUDED.host_id,
+           org_name = EXCLUDED.org_name,
+           num_followers = EXCLUDED.num_followers,
+           host_rating = EXCLUDED.host_rating,
+           title = EXCLUDED.title,
+           thumbnail = EXCLUDED.thumbnail,
+           event_type = EXCLUDED.event_type,
+           start_time = EXCLUDED.start_time,
+           end_time = EXCLUDED.end_time,
+           minimum_cost = EXCLUDED.minimum_cost,
+           likes = EXCLUDED.likes,
+           cancelled = EXCLUDED.cancelled,
+           location = EXCLUDED.location,
+           latitude = EXCLUDED.latitude,
+           longitude = EXCLUDED.longitude,
+           tags = EXCLUDED.tags,
+           search_vector = EXCLUDED.search_vector;
+END
+$$ LANGUAGE plpgsql;
+
+-- Trigger to keep the search document in sync with the event
+CREATE OR REPLACE FUNCTION update_event_search_document()
+RETURNS TRIGGER AS $$
+BEGIN
+   CASE TG_OP
+   WHEN 'INSERT' THEN
+        PERFORM refresh_event_search_document(NEW.event_id);
+   WHEN 'UPDATE' THEN
+        -- reactions and edits that leave the text alone only copy the changed columns
+        IF (NEW.title, NEW.summary, NEW.description, NEW.host_id)
+           IS NOT DISTINCT FROM (OLD.title, OLD.summary, OLD.description, OLD.host_id) THEN
+            UPDATE event_search_documents AS d
+            SET    thumbnail = NEW.thumbnail,
+                   event_type = NEW.event_type,
+                   start_time = NEW.start_time,
+                   end_time = NEW.end_time,
+                   minimum_cost = NEW.minimum_cost,
+                   likes = NEW.likes,
+                   cancelled = NEW.cancelled
+            WHERE  d.event_id = NEW.event_id;
+        ELSE
+            PERFORM refresh_event_search_document(NEW.event_id);
+        END IF;
+   ELSE
+        RAISE EXCEPTION 'Unexpected TG_OP: "%". Should not occur!', TG_OP;
+   END CASE;
+   RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_event_search_document
+AFTER INSERT OR UPDATE ON events
+FOR EACH ROW EXECUTE PROCEDURE update_event_search_document();
+
+-- Trigger to refresh the search document when event tags change
+CREATE OR REPLACE FUNCTION update_event_tags_search_document()
+RETURNS TRIGGER AS $$
+BEGIN
+   CASE TG_OP
+   WHEN 'INSERT' THEN
+        PERFORM refresh_event_search_document(NEW.event_id);
+   WHEN 'DELETE' THEN
+        PERFORM refresh_event_search_document(OLD.event_id);
+   ELSE
+        RAISE EXCEPTION 'Unexpected TG_OP: "%". Should not occur!', TG_OP;
+   END CASE;
+   RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_event_tags_search_document
+AFTER INSERT OR DELETE ON event_tags
+FOR EACH ROW EXECUTE PROCEDURE update_event_tags_search_document();
+
+-- Trigger to refresh the search document once the event location is added
+CREATE OR REPLACE FUNCTION update_not_seated_event_search_document()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_event_search_document(NEW.not_seated_event_id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_not_seated_event_search_document
+AFTER INSERT OR UPDATE ON not_seated_events
+FOR EACH ROW EXECUTE PROCEDURE update_not_seated_event_search_document();
+
+CREATE OR REPLACE FUNCTION update_seated_event_search_document()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_event_search_document(NEW.seated_event_id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_seated_event_search_document
+AFTER INSERT OR UPDATE ON seated_events
+FOR EACH ROW EXECUTE PROCEDURE update_seated_event_search_document();
+
+-- Trigger to copy venue location changes to the documents of its events
+CREATE OR REPLACE FUNCTION update_venue_search_documents()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE event_search_documents AS d
+    SET    location = NEW.location,
+           latitude = NEW.latitude,
+           longitude = NEW.longitude
+    FROM   seated_events AS se
+    WHERE  se.venue_id = NEW.venue_id
+    AND    d.event_id = se.seated_event_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_venue_search_documents
+AFTER UPDATE OF location, latitude, longitude ON venues
+FOR EACH ROW EXECUTE PROCEDURE update_venue_search_documents();
+
+-- Trigger to copy host changes to the documents of its events
+CREATE OR REPLACE FUNCTION update_host_search_documents()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.org_name IS DISTINCT FROM OLD.org_name THEN
+        PERFORM refresh_event_search_document(e.event_id)
+        FROM    events AS e
+        WHERE   e.host_id = NEW.host_id;
+    ELSE
+        UPDATE event_search_documents AS d
+        SET    num_followers = NEW.num_followers,
+               host_rating = NEW.rating
+        WHERE  d.host_id = NEW.host_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_host_search_documents
+AFTER UPDATE OF org_name, num_followers, rating ON hosts
+FOR EACH ROW EXECUTE PROCEDURE update_host_search_documents();
+
+-- Backfill events created before the search triggers existed
+SELECT refresh_event_search_document(e.event_id)
+FROM   events AS e
+WHERE  NOT EXISTS (SELECT 1 FROM event_search_documents AS d WHERE d.event_id = e.event_id);
+
+
 -----------------------------------------------------------------------------
 ------------------------------ Host Followers -------------------------------
 
@@ -185,37 +386,50 @@ FOR EACH ROW EXECUTE PROCEDURE update_num_events();
 -----------------------------------------------------------------------------
 ------------------------------ Average Rating -------------------------------
 
-CREATE OR REPLACE FUNCTION update_host_average_rating()
-RETURNS TRIGGER AS
-$$
-DECLARE
-    total_rating INTEGER;
-    review_count INTEGER;
-    avg_rating NUMERIC(10, 2);
+-- Add a review's rating to, or with a direction of -1 take it from, the running totals of its event and host
+CREATE OR REPLACE FUNCTION add_review_rating(review event_reviews, direction INTEGER)
+RETURNS VOID AS $$
 BEGIN
-    SELECT SUM(rating), COUNT(*) INTO total_rating, review_count
-    FROM event_reviews
-    WHERE event_host = NEW.event_host;
-    
-    IF review_count > 0 THEN
-        avg_rating := total_rating::NUMERIC / review_count;
-    ELSE
-        avg_rating := 0;
-    END IF;
-    
-    UPDATE hosts
-    SET rating = avg_rating
-    WHERE host_id = NEW.event_host;
-    
-    RETURN NEW;
-END;
-$$
-LANGUAGE plpgsql;
+    UPDATE events AS e
+    SET    rating_sum = e.rating_sum + direction * review.rating,
+           rating_count = e.rating_count + direction,
+           rating_counts[review.rating + 1] = e.rating_counts[review.rating + 1] + direction
+    WHERE  e.event_id = review.event_id;
+
+    UPDATE hosts AS h
+    SET    rating_sum = h.rating_sum + direction * review.rating,
+           rating_count = h.rating_count + direction,
+           rating_counts[review.rating + 1] = h.rating_counts[review.rating + 1] + direction,
+           rating = CASE WHEN h.rating_count + direction > 0
+                         THEN (h.rating_sum + direction * review.rating)::NUMERIC / (h.rating_count + direction)
+                         ELSE 0
+                    END
+    WHERE  h.host_id = review.event_host;
+END
+$$ LANGUAGE plpgsql;
 
-CREATE TRIGGER calculate_average_rating
-AFTER INSERT OR UPDATE ON event_reviews
-FOR EACH ROW
-EXECUTE FUNCTION update_host_average_rating();
+-- Trigger to keep the rating totals and per rating counts of events and hosts without rescanning their reviews
+CREATE OR REPLACE FUNCTION update_review_ratings()
+RETURNS TRIGGER AS $$
+BEGIN
+   CASE TG_OP
+   WHEN 'INSERT' THEN
+        PERFORM add_review_rating(NEW, 1);
+   WHEN 'UPDATE' THEN
+        PERFORM add_review_rating(OLD, -1);
+        PERFORM add_review_rating(NEW, 1);
+   WHEN 'DELETE' THEN
+        PERFORM add_review_rating(OLD, -1);
+   ELSE
+        RAISE EXCEPTION 'Unexpected TG_OP: "%". Should not occur!', TG_OP;
+   END CASE;
+   RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_review_ratings
+AFTER INSERT OR UPDATE OF rating, event_id, event_host OR DELETE ON event_reviews
+FOR EACH ROW EXECUTE PROCEDURE update_review_ratings();
 
 -----------------------------------------------------------------------------
 -------------------------------- Event Chat ---------------------------------
@@ -270,3 +484,220 @@ CREATE TRIGGER update_review_likes_trigger
 AFTER INSERT OR DELETE
 ON review_likes
 FOR EACH ROW EXECUTE PROCEDURE update_review_likes();
+
+
+-----------------------------------------------------------------------------
+-------------------------- User Recommendations -----------------------------
+
+-- Trigger to remove a cancelled event from every customer's recommendations
+CREATE OR REPLACE FUNCTION remove_cancelled_event_recommendations()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.cancelled IS TRUE AND OLD.cancelled IS NOT TRUE THEN
+        DELETE FROM user_recommendations AS ur
+        WHERE  ur.event_id = NEW.event_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER remove_cancelled_event_recommendations
+AFTER UPDATE OF cancelled ON events
+FOR EACH ROW EXECUTE PROCEDURE remove_cancelled_event_recommendations();
+
+
+-----------------------------------------------------------------------------
+---------------------------- Event Activity ---------------------------------
+
+-- Trigger to count today's likes and bookings of an event for trending
+CREATE OR REPLACE FUNCTION log_event_activity()
+RETURNS TRIGGER AS $$
+BEGIN
+   CASE TG_TABLE_NAME
+   WHEN 'likes' THEN
+        INSERT INTO event_activity_log AS l (event_id, date, likes)
+        VALUES (NEW.event_id, CURRENT_DATE, 1)
+        ON CONFLICT (event_id, date) DO UPDATE
+        SET    likes = l.likes + 1;
+   WHEN 'bookings' THEN
+        INSERT INTO event_activity_log AS l (event_id, date, bookings)
+        VALUES (NEW.event_id, CURRENT_DATE, 1)
+        ON CONFLICT (event_id, date) DO UPDATE
+        SET    bookings = l.bookings + 1;
+   ELSE
+        RAISE EXCEPTION 'Unexpected TG_TABLE_NAME: "%". Should not occur!', TG_TABLE_NAME;
+   END CASE;
+   RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER log_like_event_activity
+AFTER INSERT ON likes
+FOR EACH ROW EXECUTE PROCEDURE log_event_activity();
+
+CREATE TRIGGER log_booking_event_activity
+AFTER INSERT ON bookings
+FOR EACH ROW EXECUTE PROCEDURE log_event_activity();
+
+
+-----------------------------------------------------------------------------
+---------------------------- Host Versions ----------------------------------
+
+-- Bump the version of a host so their cached public profile is revalidated
+CREATE OR REPLACE FUNCTION bump_host_version(id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO host_versions AS v (host_id, version)
+    SELECT h.host_id, 1
+    FROM   hosts AS h
+    WHERE  h.host_id = id
+    ON CONFLICT (host_id) DO UPDATE
+    SET    version = v.version + 1;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_host_profile_version()
+RETURNS TRIGGER AS $$
+BEGIN
+   CASE TG_OP
+   WHEN 'UPDATE' THEN
+        PERFORM bump_host_version(NEW.host_id);
+   ELSE
+        RAISE EXCEPTION 'Unexpected TG_OP: "%". Should not occur!', TG_OP;
+   END CASE;
+   RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER bump_host_version
+AFTER UPDATE ON hosts
+FOR EACH ROW EXECUTE PROCEDURE bump_host_profile_version();
+
+
+-----------------------------------------------------------------------------
+---------------------------- Event Versions ---------------------------------
+
+-- Bump the version of an event so cached event details are reloaded
+CREATE OR REPLACE FUNCTION bump_event_version(id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO event_versions AS v (event_id, version)
+    SELECT e.event_id, 1
+    FROM   events AS e
+    WHERE  e.event_id = id
+    ON CONFLICT (event_id) DO UPDATE
+    SET    version = v.version + 1;
+
+    -- the host's public profile shows their events
+    PERFORM bump_host_version(e.host_id)
+    FROM    events AS e
+    WHERE   e.event_id = id;
+END
+$$ LANGUAGE plpgsql;
+
+-- Trigger to bump the event version on writes to the event or any of its details,
+-- the argument names the column holding the event id
+CREATE OR REPLACE FUNCTION bump_event_detail_version()
+RETURNS TRIGGER AS $$
+DECLARE
+    written JSONB;
+    id INTEGER;
+BEGIN
+   CASE TG_OP
+   WHEN 'INSERT', 'UPDATE' THEN
+        written := to_jsonb(NEW);
+   WHEN 'DELETE' THEN
+        written := to_jsonb(OLD);
+   ELSE
+        RAISE EXCEPTION 'Unexpected TG_OP: "%". Should not occur!', TG_OP;
+   END CASE;
+
+   id := (written ->> TG_ARGV[0])::INTEGER;
+
+   -- sections only know their reserve
+   IF TG_TABLE_NAME = 'event_sections' THEN
+        SELECT r.event_id INTO id FROM event_reserves AS r WHERE r.event_reserve_id = id;
+   END IF;
+
+   PERFORM bump_event_version(id);
+   RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER bump_event_version
+AFTER UPDATE ON events
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('event_id');
+
+CREATE TRIGGER bump_online_event_version
+AFTER INSERT OR UPDATE OR DELETE ON online_events
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('online_event_id');
+
+CREATE TRIGGER bump_seated_event_version
+AFTER INSERT OR UPDATE OR DELETE ON seated_events
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('seated_event_id');
+
+CREATE TRIGGER bump_not_seated_event_version
+AFTER INSERT OR UPDATE OR DELETE ON not_seated_events
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('not_seated_event_id');
+
+CREATE TRIGGER bump_event_reserve_version
+AFTER INSERT OR UPDATE OR DELETE ON event_reserves
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('event_id');
+
+CREATE TRIGGER bump_event_section_version
+AFTER INSERT OR UPDATE OR DELETE ON event_sections
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('event_reserve_id');
+
+CREATE TRIGGER bump_event_review_version
+AFTER INSERT OR UPDATE OR DELETE ON event_reviews
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('event_id');
+
+CREATE TRIGGER bump_event_tag_version
+AFTER INSERT OR UPDATE OR DELETE ON event_tags
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('event_id');
+
+CREATE TRIGGER bump_event_media_version
+AFTER INSERT OR UPDATE OR DELETE ON event_media
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('event_id');
+
+CREATE TRIGGER bump_faq_version
+AFTER INSERT OR UPDATE OR DELETE ON faq
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('event_id');
+
+CREATE TRIGGER bump_event_announcement_version
+AFTER INSERT OR UPDATE OR DELETE ON event_announcements
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('event_id');
+
+-- bookings decide whether an event can still be edited
+CREATE TRIGGER bump_booking_event_version
+AFTER INSERT OR UPDATE OF cancelled OR DELETE ON bookings
+FOR EACH ROW EXECUTE PROCEDURE bump_event_detail_version('event_id');
+
+
+-----------------------------------------------------------------------------
+--------------------------- Content Versions --------------------------------
+
+-- Trigger to bump the version of a listing served whole, the argument names the listing
+CREATE OR REPLACE FUNCTION bump_content_version()
+RETURNS TRIGGER AS $$
+BEGIN
+   CASE TG_OP
+   WHEN 'INSERT', 'UPDATE', 'DELETE' THEN
+        INSERT INTO content_versions AS v (name, version)
+        VALUES (TG_ARGV[0], 1)
+        ON CONFLICT (name) DO UPDATE
+        SET    version = v.version + 1;
+   ELSE
+        RAISE EXCEPTION 'Unexpected TG_OP: "%". Should not occur!', TG_OP;
+   END CASE;
+   RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER bump_venue_content_version
+AFTER INSERT OR UPDATE OR DELETE ON venues
+FOR EACH STATEMENT EXECUTE PROCEDURE bump_content_version('venues');
+
+CREATE TRIGGER bump_venue_section_content_version
+AFTER INSERT OR UPDATE OR DELETE ON venue_sections
+FOR EACH STATEMENT EXECUTE PROCEDURE bump_content_version('venues');
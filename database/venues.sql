@@ -1,7 +1,7 @@
-INSERT INTO venues ("name", "location", "location_coords")
+INSERT INTO venues ("name", "location", "location_coords", "latitude", "longitude")
 VALUES 
-    ('Qudos Bank Arena', 'Qudos Bank Arena', '-33.870380,151.190079'),
-    ('Rod Laver Arena', 'Rod Laver Arena', '-36.183338,146.939926');
+    ('Qudos Bank Arena', 'Qudos Bank Arena', '-33.870380,151.190079', -33.870380, 151.190079),
+    ('Rod Laver Arena', 'Rod Laver Arena', '-36.183338,146.939926', -36.183338, 146.939926);
 
 INSERT INTO venue_sections ("section_id", "venue_id", "section_name", "total_seats")
 VALUES 